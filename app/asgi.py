@@ -12,6 +12,7 @@ from loguru import logger
 from app.config import config
 from app.models.exception import HttpException
 from app.router import root_api_router
+from app.services import bgm, media_index, transcriber
 from app.utils import utils
 
 
@@ -75,8 +76,14 @@ app.mount("/", StaticFiles(directory=public_dir, html=True), name="")
 @app.on_event("shutdown")
 def shutdown_event():
     logger.info("shutdown event")
+    transcriber.stop()
 
 
 @app.on_event("startup")
 def startup_event():
     logger.info("startup event")
+    utils.run_in_background(media_index.refresh)
+    utils.run_in_background(bgm.prepare_library)
+    if transcriber.enabled():
+        # load whisper now, not in the first task after a deploy
+        utils.run_in_background(transcriber.start)
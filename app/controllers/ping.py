@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Request
 
+from app.services import transcriber
+
 router = APIRouter()
 
 
@@ -11,3 +13,12 @@ router = APIRouter()
 )
 def ping(request: Request) -> str:
     return "pong"
+
+
+@router.get(
+    "/ping/transcriber",
+    tags=["Health Check"],
+    description="whisper worker readiness and queue depth",
+)
+def ping_transcriber(request: Request) -> dict:
+    return transcriber.stats()
@@ -1,4 +1,3 @@
-import glob
 import os
 import pathlib
 import shutil
@@ -26,6 +25,7 @@ from app.models.schema import (
     TaskResponse,
     TaskVideoRequest,
 )
+from app.services import bgm
 from app.services import state as sm
 from app.services import task as tm
 from app.utils import utils
@@ -183,9 +183,7 @@ def delete_video(request: Request, task_id: str = Path(..., description="Task ID
     "/musics", response_model=BgmRetrieveResponse, summary="Retrieve local BGM files"
 )
 def get_bgm_list(request: Request):
-    suffix = "*.mp3"
-    song_dir = utils.song_dir()
-    files = glob.glob(os.path.join(song_dir, suffix))
+    files = bgm.list_songs()
     bgm_list = []
     for file in files:
         bgm_list.append(
@@ -215,6 +213,8 @@ def upload_bgm_file(request: Request, file: UploadFile = File(...)):
             # If the file already exists, it will be overwritten
             file.file.seek(0)
             buffer.write(file.file.read())
+        # decode and normalize now, not during the first render using it
+        utils.run_in_background(bgm.prepare, save_path)
         response = {"file": save_path}
         return utils.get_response(200, response)
 
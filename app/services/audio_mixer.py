@@ -0,0 +1,112 @@
+"""
+Offline audio mixer: voice and bgm are decoded into NumPy arrays and mixed
+into one finished track before any video is encoded, so the encoders only
+have to mux it.
+"""
+import wave
+
+import numpy as np
+from loguru import logger
+
+from app.services.utils import ffmpeg
+
+sample_rate = 44100
+channels = 2
+
+
+def read_pcm(file: str, sample_rate: int = sample_rate, channels: int = channels) -> np.ndarray:
+    # (samples, channels) float32 in [-1, 1]
+    data = np.frombuffer(ffmpeg.decode_pcm(file, sample_rate, channels), dtype=np.float32)
+    return data[: len(data) - len(data) % channels].reshape(-1, channels)
+
+
+def write_wav(file: str, samples: np.ndarray, sample_rate: int = sample_rate) -> str:
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(file, "wb") as f:
+        f.setnchannels(pcm.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    return file
+
+
+def wav_duration(file: str) -> float:
+    with wave.open(file, "rb") as f:
+        return f.getnframes() / float(f.getframerate())
+
+
+def loop_to(samples: np.ndarray, length: int) -> np.ndarray:
+    if len(samples) >= length:
+        return samples[:length]
+    repeats = -(-length // len(samples))
+    return np.tile(samples, (repeats, 1))[:length]
+
+
+def fade_out(samples: np.ndarray, seconds: float, sample_rate: int = sample_rate) -> np.ndarray:
+    fade_length = min(len(samples), int(seconds * sample_rate))
+    if fade_length > 0:
+        samples[-fade_length:] *= np.linspace(1.0, 0.0, fade_length, dtype=np.float32)[:, None]
+    return samples
+
+
+def ducking_gain(
+    voice: np.ndarray,
+    depth: float,
+    sample_rate: int = sample_rate,
+    threshold: float = 0.02,
+    window: float = 0.05,
+    release: float = 0.3,
+) -> np.ndarray:
+    """
+    per-sample gain for the bgm: 1 - depth while the voice is speaking.
+    speech is detected by the rms of short windows, the on/off curve is
+    smoothed over `release` seconds so the bgm ramps instead of pumping
+    """
+    hop = max(1, int(window * sample_rate))
+    frames = -(-len(voice) // hop)
+    mono = np.zeros(frames * hop, dtype=np.float32)
+    mono[: len(voice)] = voice.mean(axis=1)
+    rms = np.sqrt(np.mean(np.square(mono.reshape(frames, hop)), axis=1))
+
+    active = (rms > threshold).astype(np.float32)
+    size = 2 * max(1, int(release / window)) + 1
+    active = np.convolve(active, np.ones(size, dtype=np.float32) / size, mode="same")
+
+    frame_gain = 1.0 - depth * np.clip(active * 2, 0.0, 1.0)
+    frame_times = np.arange(frames) * hop + hop / 2
+    return np.interp(np.arange(len(voice)), frame_times, frame_gain).astype(np.float32)
+
+
+def mix(
+    voice_file: str,
+    output_file: str,
+    bgm_file: str = "",
+    voice_volume: float = 1.0,
+    bgm_volume: float = 0.2,
+    duration: float = 0.0,
+    fade_seconds: float = 3.0,
+    ducking: float = 0.0,
+) -> str:
+    """
+    mixes the voice and the looped bgm into a 16-bit wav. the track is as long as
+    the voice, or `duration` if longer; the bgm fades out over the last fade_seconds.
+    ducking (0..1) lowers the bgm by that fraction while the voice is speaking
+    """
+    voice = read_pcm(voice_file) * np.float32(voice_volume)
+    length = max(len(voice), int(duration * sample_rate))
+    mixed = np.zeros((length, channels), dtype=np.float32)
+    mixed[: len(voice)] += voice
+
+    if bgm_file:
+        music = read_pcm(bgm_file)
+        if len(music):
+            music = loop_to(music, length) * np.float32(bgm_volume)
+            if ducking > 0:
+                music *= ducking_gain(mixed, min(1.0, ducking))[:, None]
+            mixed += fade_out(music, fade_seconds)
+        else:
+            logger.warning(f"bgm has no audio: {bgm_file}")
+
+    write_wav(output_file, mixed)
+    logger.info(f"audio mixed: {length / sample_rate:.2f}s, bgm: {bgm_file or 'none'} => {output_file}")
+    return output_file
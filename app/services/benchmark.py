@@ -0,0 +1,173 @@
+"""
+Rendering benchmarks.
+
+usage:
+    python -m app.services.benchmark merge [max_clips]
+    python -m app.services.benchmark profiles [duration]
+    python -m app.services.benchmark correct [lines]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+from loguru import logger
+
+from app.services import subtitle, video
+from app.services.utils import ffmpeg
+from app.services.utils.render_profile import get_render_profile, profile_names
+from app.utils import utils
+
+
+def make_test_clip(output_file: str, duration: float = 6, size: str = "1080x1920"):
+    ffmpeg.run(
+        [
+            "-f", "lavfi",
+            "-i", f"testsrc2=size={size}:rate={video.fps}:duration={duration}",
+            "-c:v", video.video_codec,
+            "-pix_fmt", "yuv420p",
+            "-preset", "ultrafast",
+            output_file,
+        ]
+    )
+    return output_file
+
+
+def bench_merge(max_clips: int = 16, clip_duration: float = 6):
+    work_dir = tempfile.mkdtemp(prefix="bench-merge-")
+    try:
+        clip_file = make_test_clip(os.path.join(work_dir, "clip.mp4"), clip_duration)
+        results = []
+        clip_count = 2
+        while clip_count <= max_clips:
+            output_file = os.path.join(work_dir, f"merged-{clip_count}.mp4")
+            start = timer()
+            video.merge_clips([clip_file] * clip_count, output_file)
+            elapsed = timer() - start
+            results.append((clip_count, elapsed))
+            logger.info(
+                f"merge {clip_count:>3} clips: {elapsed:.2f}s, {elapsed / clip_count:.3f}s per clip"
+            )
+            clip_count *= 2
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_profiles(duration: float = 10):
+    # encode the same source with every render profile, report encode time vs. file size
+    work_dir = tempfile.mkdtemp(prefix="bench-profiles-")
+    try:
+        source_file = make_test_clip(os.path.join(work_dir, "source.mp4"), duration)
+        results = []
+        for name in profile_names():
+            profile = get_render_profile(name)
+            output_file = os.path.join(work_dir, f"{name}.mp4")
+            start = timer()
+            ffmpeg.run(
+                [
+                    "-i", source_file,
+                    "-c:v", video.video_codec,
+                    "-pix_fmt", "yuv420p",
+                    "-r", str(profile.fps),
+                    *profile.encoder_args(),
+                    output_file,
+                ]
+            )
+            elapsed = timer() - start
+            size = os.path.getsize(output_file)
+            results.append((name, elapsed, size))
+            logger.info(
+                f"profile {name:<10} {elapsed:6.2f}s, {size / 1024 / 1024:7.2f} MB, "
+                f"{elapsed / duration:.2f}x realtime ({profile})"
+            )
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def make_test_subtitles(lines: int, seed: int = 1):
+    """
+    a script and a whisper-like transcript of it: lines are split in two or
+    merged with the next one, letters are misheard and the punctuation is lost.
+    returns the script, the subtitle items and the expected time range of every line
+    """
+    rng = random.Random(seed)
+    words = "the quick brown fox jumps over lazy dog video script money printer turbo subtitle".split()
+    script_lines = [" ".join(rng.choice(words) for _ in range(rng.randint(4, 10))) for _ in range(lines)]
+
+    expected, pieces = [], []
+    t = 0.0
+    for line in script_lines:
+        duration = len(line) / 15
+        expected.append((t, t + duration))
+        pieces.append((line, t, t + duration))
+        t += duration + 0.2
+
+    items = []
+    i = 0
+    while i < len(pieces):
+        text, start, end = pieces[i]
+        chance = rng.random()
+        if chance < 0.2 and " " in text:
+            # one script line heard as two subtitles
+            cut = text.index(" ", len(text) // 3)
+            middle = start + (end - start) * cut / len(text)
+            items += [(text[:cut], start, middle), (text[cut + 1 :], middle, end)]
+        elif chance < 0.3 and i + 1 < len(pieces):
+            # two script lines heard as one subtitle
+            items.append((f"{text} {pieces[i + 1][0]}", start, pieces[i + 1][2]))
+            i += 1
+        else:
+            items.append((text, start, end))
+        i += 1
+
+    misheard = []
+    for text, start, end in items:
+        chars = list(text)
+        for _ in range(len(chars) // 15):
+            chars[rng.randrange(len(chars))] = rng.choice("aeiou")
+        misheard.append(("".join(chars), start, end))
+    return ", ".join(script_lines) + ".", misheard, expected
+
+
+def bench_correct(lines: int = 120):
+    # aligns a transcript with its script, reports the time and how many lines start within 0.25s
+    work_dir = tempfile.mkdtemp(prefix="bench-correct-")
+    try:
+        script, items, expected = make_test_subtitles(lines)
+        subtitle_file = os.path.join(work_dir, "subtitle.srt")
+        with open(subtitle_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(utils.text_to_srt(i, *item) for i, item in enumerate(items, start=1)) + "\n")
+
+        start = timer()
+        subtitle.correct(subtitle_file, script)
+        elapsed = timer() - start
+
+        corrected = subtitle.file_to_subtitles(subtitle_file)
+        matched = 0
+        for (_, times, _), (expected_start, expected_end) in zip(corrected, expected):
+            if abs(utils.srt_time_to_seconds(times.split(" --> ")[0]) - expected_start) < 0.25:
+                matched += 1
+        kernel = "rapidfuzz" if subtitle._levenshtein is not None else "bit-parallel"
+        logger.info(
+            f"correct {lines} lines / {len(items)} subtitles ({kernel}): {elapsed:.2f}s, "
+            f"{matched}/{lines} lines start on time"
+        )
+        return elapsed, matched
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    name = sys.argv[1] if len(sys.argv) > 1 else "merge"
+    if name == "merge":
+        bench_merge(int(sys.argv[2]) if len(sys.argv) > 2 else 16)
+    elif name == "profiles":
+        bench_profiles(float(sys.argv[2]) if len(sys.argv) > 2 else 10)
+    elif name == "correct":
+        bench_correct(int(sys.argv[2]) if len(sys.argv) > 2 else 120)
+    else:
+        logger.error(f"unknown benchmark: {name}")
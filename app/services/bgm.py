@@ -0,0 +1,134 @@
+"""
+BGM library: every song is decoded and loudness-normalized once into a
+ready-to-mix PCM asset in the cache dir, renders only slice and loop the
+prepared file.
+"""
+import glob
+import os
+import threading
+from collections import defaultdict
+from typing import List
+
+from loguru import logger
+
+from app.config import config
+from app.services import audio_mixer
+from app.services.utils import ffmpeg
+from app.services.utils.file_cache import FileCache, file_identity
+from app.utils import utils
+
+sample_rate = 44100
+channels = 2
+
+
+def loudnorm_filter() -> str:
+    # EBU R128 target, all songs end up at the same perceived loudness before bgm_volume
+    loudness = float(config.app.get("bgm_loudness", -16))
+    return f"loudnorm=I={loudness}:TP=-1.5:LRA=11"
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_prepare_locks = defaultdict(threading.Lock)
+
+
+def prepared_cache() -> FileCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FileCache(
+                utils.cache_dir("bgm"),
+                max_bytes=int(config.app.get("bgm_cache_max_bytes", 0) or 0),
+                suffix=".wav",
+            )
+        return _cache
+
+
+_songs = []
+_songs_stamp = None
+_songs_lock = threading.Lock()
+
+
+def list_songs() -> List[str]:
+    # the listing is only refreshed when the songs directory changes
+    global _songs, _songs_stamp
+    song_dir = utils.song_dir()
+    try:
+        stamp = os.stat(song_dir).st_mtime_ns
+    except OSError:
+        return []
+
+    with _songs_lock:
+        if stamp != _songs_stamp:
+            _songs = sorted(glob.glob(os.path.join(song_dir, "*.mp3")))
+            _songs_stamp = stamp
+        return list(_songs)
+
+
+class PreparedSong:
+    def __init__(self, file_path: str, prepared_file: str, duration: float):
+        self.file_path = file_path
+        self.prepared_file = prepared_file
+        self.duration = duration
+
+    def __str__(self):
+        return f"PreparedSong(file_path={self.file_path}, prepared_file={self.prepared_file}, duration={self.duration:.2f})"
+
+
+def prepare(song_file: str) -> PreparedSong:
+    """
+    decodes and normalizes a song into a 16-bit PCM wav, cached by the
+    identity of the song and the preparation settings
+    """
+    cache = prepared_cache()
+    cache_key = cache.key(file_identity(song_file), sample_rate, channels, loudnorm_filter())
+
+    # two tasks asking for the same song wait for one preparation
+    with _prepare_locks[cache_key]:
+        prepared_file = cache.get(cache_key)
+        if not prepared_file:
+            temp_file = f"{cache.path(cache_key)}.{os.getpid()}.prepare.tmp"
+            try:
+                ffmpeg.run(
+                    [
+                        "-i", song_file,
+                        "-vn",
+                        "-af", loudnorm_filter(),
+                        "-ar", str(sample_rate),
+                        "-ac", str(channels),
+                        "-c:a", "pcm_s16le",
+                        "-f", "wav",
+                        temp_file,
+                    ]
+                )
+                prepared_file = cache.put(cache_key, temp_file)
+            finally:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+            logger.info(f"bgm prepared: {song_file} => {prepared_file}")
+
+    return PreparedSong(song_file, prepared_file, audio_mixer.wav_duration(prepared_file))
+
+
+def prepared_file(song_file: str) -> str:
+    # falls back to the original song if it cannot be prepared
+    if not song_file:
+        return ""
+    try:
+        return prepare(song_file).prepared_file
+    except Exception as e:
+        logger.warning(f"failed to prepare bgm: {song_file}, {str(e)}")
+        return song_file
+
+
+def prepare_library() -> int:
+    prepared = 0
+    for song_file in list_songs():
+        try:
+            prepare(song_file)
+            prepared += 1
+        except Exception as e:
+            logger.warning(f"failed to prepare bgm: {song_file}, {str(e)}")
+    logger.info(f"bgm library prepared: {prepared} songs")
+    return prepared
+
@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from loguru import logger
+from PIL import Image
+
+from app.models import const
+from app.services.utils import ffmpeg
+from app.utils import utils
+
+
+class MediaInfo:
+    def __init__(
+        self,
+        file_path,
+        duration=0.0,
+        width=0,
+        height=0,
+        fps=0.0,
+        codec="",
+        keyframe_interval=0.0,
+        size=0,
+        mtime_ns=0,
+    ):
+        self.file_path = file_path
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.codec = codec
+        self.keyframe_interval = keyframe_interval
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @property
+    def is_image(self):
+        return utils.parse_extension(self.file_path) in const.FILE_TYPE_IMAGES
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**data)
+
+    def __str__(self):
+        return f"MediaInfo(file_path={self.file_path}, duration={self.duration}, width={self.width}, height={self.height}, fps={self.fps}, codec={self.codec}, keyframe_interval={self.keyframe_interval})"
+
+
+def probe(file_path: str) -> MediaInfo:
+    stat = os.stat(file_path)
+    info = MediaInfo(file_path=file_path, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+    if info.is_image:
+        # only reads the image header
+        with Image.open(file_path) as image:
+            info.width, info.height = image.size
+            info.codec = (image.format or "").lower()
+        return info
+
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    infos = ffmpeg_parse_infos(file_path)
+    info.duration = infos.get("duration") or 0.0
+    info.width, info.height = infos.get("video_size") or (0, 0)
+    info.fps = infos.get("video_fps") or 0.0
+    info.codec = infos.get("video_codec_name") or ""
+    try:
+        info.keyframe_interval = ffmpeg.keyframe_interval(file_path)
+    except Exception as e:
+        logger.warning(f"failed to read keyframes: {file_path}, {str(e)}")
+    return info
+
+
+class MediaIndex:
+    """
+    persistent probe results for media files, keyed by real path.
+    an entry is re-probed when the size or modification time of its file changes.
+
+    only files below library_dir (the media dir) are saved to the index file,
+    other files (task dirs, downloads) are kept in a small in-memory LRU
+    """
+
+    def __init__(self, index_file: str, library_dir: str = "", max_transient: int = 256):
+        self.index_file = index_file
+        self.library_dir = os.path.realpath(library_dir or utils.media_dir())
+        self.max_transient = max_transient
+        self._entries = {}
+        self._transient = OrderedDict()
+        self._lock = threading.RLock()
+        self._load()
+
+    def _in_library(self, key: str) -> bool:
+        return key.startswith(self.library_dir + os.sep)
+
+    def _load(self):
+        if not os.path.isfile(self.index_file):
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            # older indexes also stored files outside the library
+            self._entries = {key: entry for key, entry in entries.items() if self._in_library(key)}
+        except Exception as e:
+            logger.warning(f"failed to load media index: {str(e)}, rebuilding")
+            self._entries = {}
+
+    def save(self):
+        with self._lock:
+            temp_file = f"{self.index_file}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(temp_file, self.index_file)
+
+    def _lookup(self, file_path: str):
+        # returns (info, changed), changed is only set for entries that have to be saved
+        key = os.path.realpath(file_path)
+        stat = os.stat(file_path)
+        persistent = self._in_library(key)
+        entries = self._entries if persistent else self._transient
+        entry = entries.get(key)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            if not persistent:
+                self._transient.move_to_end(key)
+            return MediaInfo.from_dict(entry), False
+
+        info = probe(file_path)
+        logger.debug(f"media probed: {info}")
+        entries[key] = info.to_dict()
+        if not persistent:
+            self._transient.move_to_end(key)
+            while len(self._transient) > self.max_transient:
+                self._transient.popitem(last=False)
+        return info, persistent
+
+    def get(self, file_path: str) -> MediaInfo:
+        with self._lock:
+            info, changed = self._lookup(file_path)
+            if changed:
+                self.save()
+            return info
+
+    def refresh(self, directory: str = "") -> int:
+        """
+        incrementally update the index for all media files below directory,
+        drops entries of deleted files. returns the number of (re)probed files
+        """
+        directory = os.path.realpath(directory or utils.media_dir())
+        extensions = set(const.FILE_TYPE_VIDEOS) | set(const.FILE_TYPE_IMAGES)
+        seen = set()
+        probed = 0
+        for root, _, files in os.walk(directory):
+            for file in files:
+                if utils.parse_extension(file) not in extensions:
+                    continue
+                file_path = os.path.join(root, file)
+                seen.add(os.path.realpath(file_path))
+                try:
+                    # lock per file, so tasks are not blocked by a long scan
+                    with self._lock:
+                        _, changed = self._lookup(file_path)
+                except Exception as e:
+                    logger.warning(f"failed to probe media: {file_path}, {str(e)}")
+                    continue
+                probed += int(changed)
+
+        with self._lock:
+            prefix = directory + os.sep
+            removed = [key for key in self._entries if key.startswith(prefix) and key not in seen]
+            for key in removed:
+                del self._entries[key]
+
+            if probed or removed:
+                self.save()
+
+        logger.info(f"media index refreshed: {directory}, probed: {probed}, removed: {len(removed)}, total: {len(self._entries)}")
+        return probed
+
+
+_index: Optional[MediaIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> MediaIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = MediaIndex(os.path.join(utils.cache_dir(), "media_index.json"))
+        return _index
+
+
+def get(file_path: str) -> MediaInfo:
+    return get_index().get(file_path)
+
+
+def refresh(directory: str = "") -> int:
+    return get_index().refresh(directory)
@@ -1,21 +1,62 @@
 import json
 import os.path
 import re
+import threading
+from collections import defaultdict
 from timeit import default_timer as timer
+from typing import List, Tuple
 
+import numpy as np
 from faster_whisper import WhisperModel
 from loguru import logger
 
 from app.config import config
+from app.services import audio_mixer, transcriber
+from app.services.utils.file_cache import FileCache, file_digest
 from app.utils import utils
 
+try:
+    from rapidfuzz.distance import Levenshtein as _levenshtein
+except ImportError:
+    _levenshtein = None
+
 model_size = config.whisper.get("model_size", "large-v3")
 device = config.whisper.get("device", "cpu")
 compute_type = config.whisper.get("compute_type", "int8")
 model = None
 
 
-def create(audio_file, subtitle_file: str = ""):
+# transcription options, part of the transcript cache key
+transcribe_options = dict(
+    beam_size=5,
+    word_timestamps=True,
+    vad_filter=True,
+    vad_parameters=dict(min_silence_duration_ms=500),
+)
+
+# providers whose tts returns character timestamps along with the audio
+timestamp_providers = ("elevenlabs", "synthetic")
+# providers that place the known script on the audio without running whisper
+script_providers = ("align", *timestamp_providers)
+
+_transcript_cache = None
+_transcript_locks = defaultdict(threading.Lock)
+# loading and using the in-process model is serialized
+_model_lock = threading.Lock()
+
+
+def get_provider() -> str:
+    return config.app.get("subtitle_provider", "whisper").strip().lower()
+
+
+def transcript_cache() -> FileCache:
+    global _transcript_cache
+    if _transcript_cache is None:
+        _transcript_cache = FileCache(utils.cache_dir("transcripts"), suffix=".json")
+    return _transcript_cache
+
+
+def load_model():
     global model
     if not model:
         model_path = utils.path_from_cfg("models_dir", "models") / f"whisper-{model_size}"
@@ -41,23 +82,89 @@ def create(audio_file, subtitle_file: str = ""):
                 f"********************************************\n\n"
             )
             return None
+    return model
 
-    logger.info(f"start, output file: {subtitle_file}")
-    if not subtitle_file:
-        subtitle_file = f"{audio_file}.srt"
-
-    segments, info = model.transcribe(
-        audio_file,
-        beam_size=5,
-        word_timestamps=True,
-        vad_filter=True,
-        vad_parameters=dict(min_silence_duration_ms=500),
-    )
 
+def run_transcription(audio_file):
+    # expects a loaded model, runs in the transcription worker or under _model_lock
+    start = timer()
+    segments, info = model.transcribe(audio_file, **transcribe_options)
     logger.info(
         f"detected language: '{info.language}', probability: {info.language_probability:.2f}"
     )
 
+    transcript = {
+        "language": info.language,
+        "language_probability": info.language_probability,
+        "segments": [
+            {
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text,
+                "words": [
+                    {"start": word.start, "end": word.end, "word": word.word}
+                    for word in (segment.words or [])
+                ],
+            }
+            for segment in segments
+        ],
+    }
+    logger.info(f"transcribed: {audio_file}, elapsed: {timer() - start:.2f} s")
+    return transcript
+
+
+def transcribe(audio_file):
+    """
+    segments and word timestamps of the audio file, cached by audio content,
+    model and transcription options, so every caller after the first one
+    gets the transcript without running whisper again
+    """
+    cache = transcript_cache()
+    cache_key = cache.key(file_digest(audio_file), model_size, compute_type, transcribe_options)
+
+    # concurrent callers for the same audio wait for one transcription
+    with _transcript_locks[cache_key]:
+        cached_file = cache.get(cache_key)
+        if cached_file:
+            logger.info(f"transcript cache hit: {audio_file}")
+            with open(cached_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        if transcriber.enabled():
+            # the warm worker process owns the model
+            try:
+                transcript = transcriber.get_service().transcribe(audio_file)
+            except Exception as e:
+                logger.error(f"failed to transcribe: {audio_file}, {str(e)}")
+                return None
+        else:
+            with _model_lock:
+                if not load_model():
+                    return None
+                transcript = run_transcription(audio_file)
+
+        temp_file = f"{cache.path(cache_key)}.{os.getpid()}.write.tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(transcript, f, ensure_ascii=False)
+            cache.put(cache_key, temp_file)
+        except Exception as e:
+            logger.warning(f"failed to cache transcript: {str(e)}")
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        return transcript
+
+
+def create(audio_file, subtitle_file: str = ""):
+    logger.info(f"start, output file: {subtitle_file}")
+    if not subtitle_file:
+        subtitle_file = f"{audio_file}.srt"
+
+    transcript = transcribe(audio_file)
+    if transcript is None:
+        return None
+
     start = timer()
     subtitles = []
 
@@ -73,25 +180,25 @@ def create(audio_file, subtitle_file: str = ""):
             {"msg": seg_text, "start_time": seg_start, "end_time": seg_end}
         )
 
-    for segment in segments:
+    for segment in transcript["segments"]:
         words_idx = 0
-        words_len = len(segment.words)
+        words_len = len(segment["words"])
 
         seg_start = 0
         seg_end = 0
         seg_text = ""
 
-        if segment.words:
+        if segment["words"]:
             is_segmented = False
-            for word in segment.words:
+            for word in segment["words"]:
                 if not is_segmented:
-                    seg_start = word.start
+                    seg_start = word["start"]
                     is_segmented = True
 
-                seg_end = word.end
-                seg_text += word.word
+                seg_end = word["end"]
+                seg_text += word["word"]
 
-                if utils.str_contains_punctuation(word.word):
+                if utils.str_contains_punctuation(word["word"]):
                     seg_text = seg_text[:-1]
                     if not seg_text:
                         continue
@@ -101,10 +208,10 @@ def create(audio_file, subtitle_file: str = ""):
                     is_segmented = False
                     seg_text = ""
 
-                if words_idx == 0 and segment.start < word.start:
-                    seg_start = word.start
-                if words_idx == (words_len - 1) and segment.end > word.end:
-                    seg_end = word.end
+                if words_idx == 0 and segment["start"] < word["start"]:
+                    seg_start = word["start"]
+                if words_idx == (words_len - 1) and segment["end"] > word["end"]:
+                    seg_end = word["end"]
                 words_idx += 1
 
         if not seg_text:
@@ -135,6 +242,180 @@ def create(audio_file, subtitle_file: str = ""):
     logger.info(f"subtitle file created: {subtitle_file}")
 
 
+def write_srt(subtitles, subtitle_file):
+    lines = [
+        utils.text_to_srt(idx, text, start_time, end_time)
+        for idx, (text, start_time, end_time) in enumerate(subtitles, start=1)
+    ]
+    with open(subtitle_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    logger.info(f"subtitle file created: {subtitle_file}")
+    return subtitle_file
+
+
+def speech_regions(
+    file: str,
+    sample_rate: int = 16000,
+    window: float = 0.02,
+    threshold_db: float = -35.0,
+    min_silence: float = 0.15,
+    min_speech: float = 0.05,
+) -> List[Tuple[float, float]]:
+    """
+    (start, end) seconds of the spoken parts of a voice track. a window is speech
+    when its level is within threshold_db of the loud parts of the track, pauses
+    shorter than min_silence are merged into the surrounding speech
+    """
+    samples = audio_mixer.read_pcm(file, sample_rate, 1)[:, 0]
+    hop = max(1, int(window * sample_rate))
+    frames = len(samples) // hop
+    if frames == 0:
+        return []
+
+    rms = np.sqrt(np.mean(np.square(samples[: frames * hop].reshape(frames, hop)), axis=1))
+    level = 20 * np.log10(rms + 1e-10)
+    active = level > np.percentile(level, 95) + threshold_db
+
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], active, [False]]).astype(np.int8)))
+    regions = []
+    for first, last in zip(edges[::2], edges[1::2]):
+        start, end = first * hop / sample_rate, last * hop / sample_rate
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+    return [(start, end) for start, end in regions if end - start >= min_speech]
+
+
+def align(audio_file, video_script, subtitle_file: str = ""):
+    """
+    subtitles from the known script without transcribing: the script lines are
+    laid over the speech regions of the audio by their share of the spoken
+    characters, and every line break snaps to the nearest pause within half a
+    line, so the text matches the script and only the timestamps are computed.
+
+    this is not a forced alignment of the words: a line break that snaps to a
+    pause is as exact as the pause detection (one 20 ms window), a break that
+    finds no pause is placed by the speaking rate and may be off by up to half
+    a line. it fits clean tts voices that pause at punctuation; when fewer than
+    subtitle_align_min_snapped (default 0.5) of the line breaks found a pause,
+    the voice does not follow the script's punctuation and None is returned,
+    so the caller falls back to whisper
+    """
+    if not subtitle_file:
+        subtitle_file = f"{audio_file}.srt"
+
+    script_lines = utils.split_string_by_punctuations(video_script or "")
+    if not script_lines:
+        logger.warning("no script to align")
+        return None
+
+    start = timer()
+    regions = speech_regions(audio_file)
+    if not regions:
+        logger.warning(f"no speech found: {audio_file}")
+        return None
+
+    # everything below is measured in seconds of speech, pauses excluded
+    weights = np.array([max(1, len(re.sub(r"[\W_]", "", line))) for line in script_lines], dtype=float)
+    offsets = np.concatenate([[0.0], np.cumsum([end - begin for begin, end in regions])])
+    shares = weights / weights.sum() * offsets[-1]
+    targets = np.cumsum(shares)[:-1]
+
+    def to_time(speech_offset):
+        i = min(int(np.searchsorted(offsets, speech_offset, side="right")) - 1, len(regions) - 1)
+        return regions[i][0] + speech_offset - offsets[i]
+
+    # (end of the line before, start of the line after) for every line break
+    breaks = []
+    next_pause = 0
+    for k, target in enumerate(targets):
+        tolerance = max(shares[k], shares[k + 1]) / 2
+        best = None
+        for pause in range(next_pause, len(regions) - 1):
+            distance = abs(offsets[pause + 1] - target)
+            if distance <= tolerance and (best is None or distance < abs(offsets[best + 1] - target)):
+                best = pause
+            elif offsets[pause + 1] > target + tolerance:
+                break
+        if best is None:
+            t = to_time(target)
+            breaks.append((t, t))
+        else:
+            breaks.append((regions[best][1], regions[best + 1][0]))
+            next_pause = best + 1
+
+    snapped = sum(1 for before, after in breaks if after > before)
+    min_snapped = float(config.app.get("subtitle_align_min_snapped", 0.5))
+    if breaks and snapped / len(breaks) < min_snapped:
+        logger.warning(
+            f"only {snapped} of {len(breaks)} line breaks are at a pause, the alignment is not reliable"
+        )
+        return None
+
+    starts = [regions[0][0]] + [after for _, after in breaks]
+    ends = [before for before, _ in breaks] + [regions[-1][1]]
+    subtitles = list(zip(script_lines, starts, ends))
+    for text, start_time, end_time in subtitles:
+        logger.debug("[%.2fs -> %.2fs] %s" % (start_time, end_time, text))
+
+    logger.info(
+        f"aligned {len(script_lines)} lines on {len(regions)} speech regions, "
+        f"{snapped}/{len(breaks)} breaks at a pause, elapsed: {timer() - start:.2f} s"
+    )
+    return write_srt(subtitles, subtitle_file)
+
+
+def alignment_file(audio_file):
+    # character timestamps saved by the tts next to the audio
+    return f"{audio_file}.alignment.json"
+
+
+def alignment_to_subtitles(alignment):
+    """
+    (text, start, end) lines from a character alignment. lines are broken with
+    the same rules as the script, every line is then located in the aligned
+    text and takes the times of its first and last character
+    """
+    characters = alignment.get("characters") or []
+    starts = alignment.get("character_start_times_seconds") or []
+    ends = alignment.get("character_end_times_seconds") or []
+    if not characters or len(starts) != len(characters) or len(ends) != len(characters):
+        return []
+
+    # owner[i]: the alignment entry of the i-th character of the joined text
+    owner = []
+    for i, char in enumerate(characters):
+        owner.extend([i] * len(char))
+    text = "".join(characters)
+
+    subtitles = []
+    position = 0
+    for line in utils.split_string_by_punctuations(text):
+        first = text.find(line, position)
+        if first < 0:
+            continue
+        position = first + len(line)
+        subtitles.append((line, starts[owner[first]], ends[owner[position - 1]]))
+    return subtitles
+
+
+def create_from_alignment(audio_file, subtitle_file: str = ""):
+    if not subtitle_file:
+        subtitle_file = f"{audio_file}.srt"
+
+    file = alignment_file(audio_file)
+    if not os.path.isfile(file):
+        logger.warning(f"alignment not found: {file}")
+        return None
+    with open(file, "r", encoding="utf-8") as f:
+        subtitles = alignment_to_subtitles(json.load(f))
+    if not subtitles:
+        logger.warning(f"alignment is empty: {file}")
+        return None
+    return write_srt(subtitles, subtitle_file)
+
+
 def file_to_subtitles(filename):
     if not filename or not os.path.isfile(filename):
         return []
@@ -157,116 +438,198 @@ def file_to_subtitles(filename):
     return times_texts
 
 
-def levenshtein_distance(s1, s2):
-    if len(s1) < len(s2):
-        return levenshtein_distance(s2, s1)
-
+def _bit_parallel_levenshtein(s1, s2):
+    """
+    Myers/Hyyrö bit-vector edit distance: a whole column of the distance matrix
+    is kept in two python ints, so every character of s2 costs a handful of
+    integer operations instead of a loop over s1
+    """
+    if len(s1) == 0:
+        return len(s2)
     if len(s2) == 0:
         return len(s1)
 
-    previous_row = range(len(s2) + 1)
-    for i, c1 in enumerate(s1):
-        current_row = [i + 1]
-        for j, c2 in enumerate(s2):
-            insertions = previous_row[j + 1] + 1
-            deletions = current_row[j] + 1
-            substitutions = previous_row[j] + (c1 != c2)
-            current_row.append(min(insertions, deletions, substitutions))
-        previous_row = current_row
+    match = {}
+    for i, char in enumerate(s1):
+        match[char] = match.get(char, 0) | (1 << i)
+    mask = (1 << len(s1)) - 1
+    last = 1 << (len(s1) - 1)
+
+    positive, negative, distance = mask, 0, len(s1)
+    for char in s2:
+        eq = match.get(char, 0)
+        xv = eq | negative
+        xh = (((eq & positive) + positive) ^ positive) | eq
+        horizontal_positive = negative | ~(xh | positive)
+        horizontal_negative = positive & xh
+        if horizontal_positive & last:
+            distance += 1
+        elif horizontal_negative & last:
+            distance -= 1
+        horizontal_positive = (horizontal_positive << 1) | 1
+        horizontal_negative <<= 1
+        positive = (horizontal_negative | ~(xv | horizontal_positive)) & mask
+        negative = horizontal_positive & xv & mask
+    return distance
 
-    return previous_row[-1]
+
+def levenshtein_distance(s1, s2):
+    if _levenshtein is not None:
+        return _levenshtein.distance(s1, s2)
+    return _bit_parallel_levenshtein(s1, s2)
 
 
 def similarity(a, b):
-    distance = levenshtein_distance(a.lower(), b.lower())
     max_length = max(len(a), len(b))
+    if max_length == 0:
+        return 1.0
+    distance = levenshtein_distance(a.lower(), b.lower())
     return 1 - (distance / max_length)
 
 
-def correct(subtitle_file, video_script):
-    subtitle_items = file_to_subtitles(subtitle_file)
-    script_lines = utils.split_string_by_punctuations(video_script)
+def _normalize(text):
+    # whisper punctuates and spaces differently from the script, only the letters are compared
+    return re.sub(r"[\W_]+", "", text.lower())
+
+
+def align_lines(script_lines, subtitle_lines, max_group: int = 0, band: int = 0):
+    """
+    global alignment of script lines to subtitle items. the subtitle items are
+    split into consecutive groups, one per script line (a group may be empty when
+    whisper merged lines), so that the summed edit distance between every script
+    line and the joined text of its group is minimal.
+
+    returns one (first, last) subtitle index range per script line, last is
+    exclusive and first == last for an empty group
+    """
+    n, m = len(script_lines), len(subtitle_lines)
+    scripts = [_normalize(line) for line in script_lines]
+    subtitles = [_normalize(line) for line in subtitle_lines]
+    max_group = max_group or max(4, -(-2 * m // max(n, 1)))
+
+    # the path stays near the diagonal given by the character counts
+    script_offsets = np.cumsum([0] + [len(s) for s in scripts])
+    subtitle_offsets = np.cumsum([0] + [len(s) for s in subtitles])
+    scale = subtitle_offsets[-1] / max(script_offsets[-1], 1)
+    centers = np.searchsorted(subtitle_offsets, script_offsets * scale)
+    band = band or max(8, 2 * max_group)
+
+    inf = float("inf")
+    cost = np.full((n + 1, m + 1), inf)
+    choice = np.zeros((n + 1, m + 1), dtype=np.int64)
+    cost[0, 0] = 0
+    for i in range(1, n + 1):
+        low, high = max(0, centers[i] - band), min(m, centers[i] + band)
+        if i == n:
+            high = m
+        for j in range(low, high + 1):
+            best, best_k = inf, j
+            text = ""
+            for k in range(j, max(-1, j - max_group - 1), -1):
+                if k < j:
+                    text = subtitles[k] + text
+                # the length difference is a lower bound of the distance
+                if cost[i - 1, k] + abs(len(text) - len(scripts[i - 1])) >= best:
+                    continue
+                if k == j:
+                    distance = len(scripts[i - 1])
+                elif text == scripts[i - 1]:
+                    distance = 0
+                else:
+                    distance = levenshtein_distance(scripts[i - 1], text)
+                if cost[i - 1, k] + distance < best:
+                    best, best_k = cost[i - 1, k] + distance, k
+            cost[i, j], choice[i, j] = best, best_k
 
-    corrected = False
-    new_subtitle_items = []
-    script_index = 0
-    subtitle_index = 0
+    if cost[n, m] == inf:
+        if band >= m and max_group >= m:
+            return None
+        # the band was too narrow for this pair, align without it
+        return align_lines(script_lines, subtitle_lines, max_group=m, band=m)
 
-    while script_index < len(script_lines) and subtitle_index < len(subtitle_items):
-        script_line = script_lines[script_index].strip()
-        subtitle_line = subtitle_items[subtitle_index][2].strip()
+    groups = []
+    j = m
+    for i in range(n, 0, -1):
+        k = int(choice[i, j])
+        groups.append((k, j))
+        j = k
+    groups.reverse()
+    return groups
 
-        if script_line == subtitle_line:
-            new_subtitle_items.append(subtitle_items[subtitle_index])
-            script_index += 1
-            subtitle_index += 1
-        else:
-            combined_subtitle = subtitle_line
-            start_time = subtitle_items[subtitle_index][1].split(" --> ")[0]
-            end_time = subtitle_items[subtitle_index][1].split(" --> ")[1]
-            next_subtitle_index = subtitle_index + 1
-
-            while next_subtitle_index < len(subtitle_items):
-                next_subtitle = subtitle_items[next_subtitle_index][2].strip()
-                if similarity(
-                    script_line, combined_subtitle + " " + next_subtitle
-                ) > similarity(script_line, combined_subtitle):
-                    combined_subtitle += " " + next_subtitle
-                    end_time = subtitle_items[next_subtitle_index][1].split(" --> ")[1]
-                    next_subtitle_index += 1
-                else:
-                    break
 
-            if similarity(script_line, combined_subtitle) > 0.8:
-                logger.warning(
-                    f"Merged/Corrected - Script: {script_line}, Subtitle: {combined_subtitle}"
-                )
-                new_subtitle_items.append(
-                    (
-                        len(new_subtitle_items) + 1,
-                        f"{start_time} --> {end_time}",
-                        script_line,
-                    )
-                )
-                corrected = True
-            else:
-                logger.warning(
-                    f"Mismatch - Script: {script_line}, Subtitle: {combined_subtitle}"
-                )
-                new_subtitle_items.append(
-                    (
-                        len(new_subtitle_items) + 1,
-                        f"{start_time} --> {end_time}",
-                        script_line,
-                    )
-                )
-                corrected = True
-
-            script_index += 1
-            subtitle_index = next_subtitle_index
-
-    while script_index < len(script_lines):
-        logger.warning(f"Extra script line: {script_lines[script_index]}")
-        if subtitle_index < len(subtitle_items):
-            new_subtitle_items.append(
-                (
-                    len(new_subtitle_items) + 1,
-                    subtitle_items[subtitle_index][1],
-                    script_lines[script_index],
-                )
-            )
-            subtitle_index += 1
-        else:
-            new_subtitle_items.append(
-                (
-                    len(new_subtitle_items) + 1,
-                    "00:00:00,000 --> 00:00:00,000",
-                    script_lines[script_index],
-                )
+def correct(subtitle_file, video_script):
+    subtitle_items = file_to_subtitles(subtitle_file)
+    script_lines = [line.strip() for line in utils.split_string_by_punctuations(video_script)]
+    if not subtitle_items or not script_lines:
+        logger.warning("nothing to correct")
+        return
+
+    start = timer()
+    subtitle_texts = [item[2].strip() for item in subtitle_items]
+    groups = align_lines(script_lines, subtitle_texts)
+    filled = [i for i, (first, last) in enumerate(groups or []) if first < last]
+    if not filled:
+        logger.warning("failed to align the script with the subtitles")
+        return
+
+    # script lines without a subtitle were merged into a neighbour by whisper, each
+    # one joins the block of the neighbour whose text holds it, lines of a block
+    # share its time by their length
+    blocks = {i: [i] for i in filled}
+    blocks[filled[0]] = list(range(filled[0] + 1))
+    blocks[filled[-1]] += list(range(filled[-1] + 1, len(groups)))
+
+    def block_cost(lines, group):
+        first, last = groups[group]
+        text = _normalize("".join(script_lines[i] for i in lines))
+        return levenshtein_distance(text, _normalize("".join(subtitle_texts[first:last])))
+
+    for previous, following in zip(filled, filled[1:]):
+        run = list(range(previous + 1, following))
+        if run:
+            split = min(
+                range(len(run) + 1),
+                key=lambda k: block_cost(blocks[previous] + run[:k], previous)
+                + block_cost(run[k:] + blocks[following], following),
             )
-        script_index += 1
-        corrected = True
+            blocks[previous] += run[:split]
+            blocks[following] = run[split:] + blocks[following]
+
+    times = [item[1].split(" --> ") for item in subtitle_items]
+    line_times = {}
+    split_lines = 0
+    for group in filled:
+        first, last = groups[group]
+        lines = blocks[group]
+        if len(lines) == 1:
+            line_times[lines[0]] = (times[first][0], times[last - 1][1])
+            continue
+        block_start = utils.srt_time_to_seconds(times[first][0])
+        block_end = utils.srt_time_to_seconds(times[last - 1][1])
+        weights = np.array([max(1, len(_normalize(script_lines[i]))) for i in lines], dtype=float)
+        edges = block_start + np.concatenate([[0.0], np.cumsum(weights)]) / weights.sum() * (block_end - block_start)
+        split_lines += len(lines)
+        for i, line_start, line_end in zip(lines, edges[:-1], edges[1:]):
+            line_times[i] = (utils.time_convert_seconds_to_hmsm(line_start), utils.time_convert_seconds_to_hmsm(line_end))
+
+    if split_lines:
+        logger.warning(f"{split_lines} script lines share the time of a merged subtitle")
+
+    corrected = len(script_lines) != len(subtitle_items)
+    new_subtitle_items = []
+    for i, script_line in enumerate(script_lines):
+        first, last = groups[i]
+        combined_subtitle = " ".join(subtitle_texts[first:last])
+        if combined_subtitle != script_line:
+            if first < last:
+                logger.warning(f"Merged/Corrected - Script: {script_line}, Subtitle: {combined_subtitle}")
+            corrected = True
+        start_time, end_time = line_times[i]
+        new_subtitle_items.append((len(new_subtitle_items) + 1, f"{start_time} --> {end_time}", script_line))
 
+    logger.info(
+        f"aligned {len(script_lines)} script lines with {len(subtitle_items)} subtitles, elapsed: {timer() - start:.2f} s"
+    )
     if corrected:
         with open(subtitle_file, "w", encoding="utf-8") as fd:
             for i, item in enumerate(new_subtitle_items):
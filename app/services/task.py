@@ -14,6 +14,7 @@ from app.config import config
 from app.models import const
 from app.models.schema import VideoConcatMode, VideoParams, MaterialInfo
 from app.services import llm, subtitle, video, voice
+from app.services.utils import readers
 from app.utils import utils
 from pathlib import Path
 
@@ -100,9 +101,20 @@ def generate_subtitle(task_id, params, video_script, audio_file):
         return ""
 
     subtitle_path = path.join(utils.task_dir(task_id), "subtitle.srt")
-    subtitle_provider = config.app.get("subtitle_provider", "whisper").strip().lower()  # 기본 Whisper
+    subtitle_provider = subtitle.get_provider()  # 기본 Whisper
     logger.info(f"\n\n## generating subtitle, provider: {subtitle_provider}")
 
+    if subtitle_provider == "align":
+        # 대본을 음성에 정렬: Whisper 없이 타임스탬프만 계산
+        if subtitle.align(audio_file=audio_file, video_script=video_script, subtitle_file=subtitle_path):
+            return subtitle_path
+        logger.warning("subtitle alignment failed, falling back to whisper")
+    elif subtitle_provider in subtitle.timestamp_providers:
+        # TTS가 반환한 문자 타임스탬프로 자막 생성, Whisper 생략
+        if subtitle.create_from_alignment(audio_file=audio_file, subtitle_file=subtitle_path):
+            return subtitle_path
+        logger.warning("no tts timestamps, falling back to whisper")
+
     subtitle.create(audio_file=audio_file, subtitle_file=subtitle_path)
     subtitle.correct(subtitle_file=subtitle_path, video_script=video_script)
 
@@ -154,6 +166,8 @@ def get_video_materials(task_id, params, video_terms, audio_duration, subtitle_s
         materials = video.preprocess_video(
             materials=selected_videos,
             clip_duration=params.video_clip_duration,
+            video_aspect=params.video_aspect,
+            output_dir=utils.task_dir(task_id),
         )
         if not materials:
             sm.state.update_task(task_id, state=const.TASK_STATE_FAILED)
@@ -186,6 +200,13 @@ def parse_subtitle_segments(subtitle_path):
     return segments
 
 
+def get_render_mode(params):
+    # "fused": final video in a single encode, "separate": combined video first, then the final video,
+    # "shared": variants assembled from segments rendered once
+    render_mode = getattr(params, "render_mode", "") or config.app.get("render_mode", "separate")
+    return render_mode.strip().lower()
+
+
 def generate_final_videos(
     task_id, params, downloaded_videos, audio_file, subtitle_path
 ):
@@ -195,10 +216,52 @@ def generate_final_videos(
         params.video_concat_mode if params.video_count == 1 else VideoConcatMode.random
     )
     video_transition_mode = params.video_transition_mode
+    render_mode = get_render_mode(params)
+
+    # 음성과 BGM은 한 번만 믹싱/AAC 인코딩해서 모든 영상에 스트림 복사로 재사용
+    mixed_audio_file = video.mix_audio(
+        audio_file, path.join(utils.task_dir(task_id), "audio-mixed.m4a"), params
+    )
 
     _progress = 50
+    if render_mode == "shared":
+        # 고유 세그먼트는 한 번만 렌더링하고, 각 영상은 순서만 바꿔 스트림 복사로 조립
+        final_video_paths = video.generate_variant_videos(
+            video_paths=downloaded_videos,
+            audio_path=audio_file,
+            subtitle_path=subtitle_path,
+            output_files=[
+                path.join(utils.task_dir(task_id), f"final-{i + 1}.mp4")
+                for i in range(params.video_count)
+            ],
+            params=params.model_copy(update={"video_concat_mode": video_concat_mode}),
+            mixed_audio_path=mixed_audio_file,
+        )
+        sm.state.update_task(task_id, progress=100)
+        return final_video_paths, combined_video_paths
+
     for i in range(params.video_count):
         index = i + 1
+        if render_mode == "fused":
+            final_video_path = path.join(utils.task_dir(task_id), f"final-{index}.mp4")
+            logger.info(f"\n\n## generating fused video: {index} => {final_video_path}")
+            # 클립, 자막, 오디오를 한 번의 인코딩으로 합치기
+            fused_params = params.model_copy(update={"video_concat_mode": video_concat_mode})
+            video.generate_fused_video(
+                video_paths=downloaded_videos,
+                audio_path=audio_file,
+                subtitle_path=subtitle_path,
+                output_file=final_video_path,
+                params=fused_params,
+                mixed_audio_path=mixed_audio_file,
+            )
+
+            _progress += 50 / params.video_count
+            sm.state.update_task(task_id, progress=_progress)
+
+            final_video_paths.append(final_video_path)
+            continue
+
         combined_video_path = path.join(
             utils.task_dir(task_id), f"combined-{index}.mp4"  # combined-1.mp4, combined-2.mp4 등
         )
@@ -227,6 +290,7 @@ def generate_final_videos(
             subtitle_path=subtitle_path,
             output_file=final_video_path,
             params=params,
+            mixed_audio_path=mixed_audio_file,
         )
 
         _progress += 50 / params.video_count / 2
@@ -261,6 +325,7 @@ def start(task_id, params: VideoParams, stop_at: str = "video"):
         results.append({"video": final_video_path})
         logger.info(f"{idx+1}/{num_videos}번째 영상 생성 완료: {final_video_path}")
     logger.success("모든 영상 생성 완료")
+    logger.info(f"readers: {readers.stats()}")
     return results
 
 
@@ -0,0 +1,331 @@
+"""
+Explicit render timeline (edit decision list) and an ffmpeg backend that
+compiles it into a single filter_complex invocation.
+"""
+import json
+from typing import List
+
+from loguru import logger
+
+from app.models.schema import VideoTransitionMode
+from app.services.utils import ffmpeg
+
+
+class TimelineEntry:
+    def __init__(
+        self,
+        source: str,
+        start: float = 0.0,
+        end: float = 0.0,
+        fit: str = "pad",
+        transition: str = None,
+        side: str = None,
+        overlay: str = None,
+        xfade: str = None,
+        xfade_duration: float = 0.0,
+    ):
+        self.source = source
+        self.start = start
+        self.end = end
+        # "pad": scale to fit and letterbox, "scale": stretch to the target size
+        self.fit = fit
+        self.transition = transition
+        self.side = side
+        # optional image drawn centered over this entry
+        self.overlay = overlay
+        # ffmpeg xfade transition from the previous entry, the two entries overlap by xfade_duration
+        self.xfade = xfade
+        self.xfade_duration = xfade_duration if xfade else 0.0
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**data)
+
+    def __str__(self):
+        return f"TimelineEntry(source={self.source}, start={self.start}, end={self.end}, fit={self.fit}, transition={self.transition}, side={self.side}, overlay={self.overlay}, xfade={self.xfade})"
+
+
+class Timeline:
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        fps: int = 30,
+        entries: List[TimelineEntry] = None,
+        audio_file: str = "",
+        audio_volume: float = 1.0,
+        audio_codec: str = "aac",
+        bgm_file: str = "",
+        bgm_volume: float = 0.2,
+        subtitle_file: str = "",
+        subtitle_style: str = "",
+        fonts_dir: str = "",
+    ):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.entries = entries or []
+        # voice track, its length does not limit the video
+        self.audio_file = audio_file
+        self.audio_volume = audio_volume
+        # "copy": audio_file is a finished track that is muxed as-is, volume and bgm are not applied
+        self.audio_codec = audio_codec
+        # looped for the whole video and faded out at the end
+        self.bgm_file = bgm_file
+        self.bgm_volume = bgm_volume
+        # burned in with libass, subtitle_style is an optional force_style for srt files
+        self.subtitle_file = subtitle_file
+        self.subtitle_style = subtitle_style
+        self.fonts_dir = fonts_dir
+
+    def overlap(self, index: int) -> float:
+        # time entry `index` shares with the previous entry during a crossfade
+        return self.entries[index].xfade_duration if index > 0 else 0.0
+
+    @property
+    def duration(self):
+        return sum(entry.duration - self.overlap(i) for i, entry in enumerate(self.entries))
+
+    def append(self, entry: TimelineEntry):
+        self.entries.append(entry)
+        return entry
+
+    def trim(self, duration: float):
+        # drops the entries after `duration` and shortens the one crossing it
+        entries = []
+        total = 0.0
+        for i, entry in enumerate(self.entries):
+            if total >= duration:
+                break
+            overlap = self.overlap(i)
+            if total + entry.duration - overlap > duration:
+                entry = TimelineEntry.from_dict({**entry.to_dict(), "end": entry.start + duration - total + overlap})
+            entries.append(entry)
+            total += entry.duration - overlap
+        self.entries = entries
+        return self
+
+    def to_dict(self):
+        data = dict(self.__dict__)
+        data["entries"] = [entry.to_dict() for entry in self.entries]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        data = dict(data)
+        data["entries"] = [TimelineEntry.from_dict(entry) for entry in data.get("entries", [])]
+        return cls(**data)
+
+    def save(self, file: str):
+        with open(file, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=4)
+        return file
+
+    @classmethod
+    def load(cls, file: str):
+        with open(file, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def fit_filter(entry: TimelineEntry, width: int, height: int) -> str:
+    if entry.fit == "scale":
+        return f"scale={width}:{height},setsar=1"
+    # scale down/up to fit inside the frame, then center on a black frame
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color=black,setsar=1"
+    )
+
+
+def slide_position(transition: str, side: str, duration: float, t: float = 1.0):
+    # overlay x/y expressions that match moviepy's SlideIn/SlideOut
+    if transition == VideoTransitionMode.slide_in.value:
+        return {
+            "left": (f"min(0,-w+w*t/{t})", "0"),
+            "right": (f"max(0,W-W*t/{t})", "0"),
+            "top": ("0", f"min(0,-h+h*t/{t})"),
+            "bottom": ("0", f"max(0,H-H*t/{t})"),
+        }.get(side, ("0", "0"))
+
+    ts = max(0.0, duration - t)
+    return {
+        "left": (f"-w*max(0,t-{ts:.3f})/{t}", "0"),
+        "right": (f"w*max(0,t-{ts:.3f})/{t}", "0"),
+        "top": ("0", f"-h*max(0,t-{ts:.3f})/{t}"),
+        "bottom": ("0", f"h*max(0,t-{ts:.3f})/{t}"),
+    }.get(side, ("0", "0"))
+
+
+def entry_graph(timeline: Timeline, entry: TimelineEntry, input_index: int, overlay_index: int, label: str) -> List[str]:
+    """
+    filter chains that turn input `input_index` into the normalized stream [label]
+    """
+    width, height, fps = timeline.width, timeline.height, timeline.fps
+    duration = entry.duration
+    chains = []
+
+    stream = f"[{input_index}:v]{fit_filter(entry, width, height)},fps={fps},format=yuv420p"
+    if entry.transition == VideoTransitionMode.fade_in.value:
+        stream += ",fade=t=in:st=0:d=1"
+    elif entry.transition == VideoTransitionMode.fade_out.value:
+        stream += f",fade=t=out:st={max(0.0, duration - 1):.3f}:d=1"
+
+    if entry.transition in (VideoTransitionMode.slide_in.value, VideoTransitionMode.slide_out.value):
+        x, y = slide_position(entry.transition, entry.side, duration)
+        chains.append(f"{stream}[{label}fg]")
+        chains.append(f"color=c=black:s={width}x{height}:r={fps}:d={duration:.3f}[{label}bg]")
+        stream = f"[{label}bg][{label}fg]overlay=x='{x}':y='{y}':shortest=1,setsar=1"
+
+    if entry.overlay:
+        chains.append(f"{stream}[{label}base]")
+        stream = f"[{label}base][{overlay_index}:v]overlay=(W-w)/2:(H-h)/2:shortest=1"
+
+    chains.append(f"{stream}[{label}]")
+    return chains
+
+
+def join_graph(timeline: Timeline, labels: List[str], output_label: str) -> List[str]:
+    """
+    joins the normalized entry streams. without crossfades this is a single concat,
+    otherwise neighbouring entries are chained with xfade (or a 2-input concat where
+    an entry has no crossfade)
+    """
+    entries = timeline.entries
+    if not any(entry.xfade for entry in entries[1:]):
+        return [f"{''.join(labels)}concat=n={len(labels)}:v=1:a=0{output_label}"]
+
+    chains = []
+    current = labels[0]
+    offset = entries[0].duration
+    for i in range(1, len(entries)):
+        entry = entries[i]
+        label = output_label if i == len(entries) - 1 else f"[x{i}]"
+        if entry.xfade:
+            offset -= entry.xfade_duration
+            chains.append(
+                f"{current}{labels[i]}xfade=transition={entry.xfade}:"
+                f"duration={entry.xfade_duration:.3f}:offset={offset:.3f}{label}"
+            )
+        else:
+            chains.append(f"{current}{labels[i]}concat=n=2:v=1:a=0{label}")
+        offset += entry.duration
+        current = label
+    return chains
+
+
+def compile_timeline(
+    timeline: Timeline,
+    output_file: str,
+    threads: int = 2,
+    video_codec: str = "libx264",
+    encoder_args: List[str] = None,
+    audio_bitrate: str = "",
+) -> List[str]:
+    """
+    ffmpeg arguments that render the whole timeline in one invocation,
+    without intermediate files. encoder_args are extra video encoder options
+    such as preset and crf
+    """
+    if not timeline.entries:
+        raise ValueError("timeline has no entries")
+
+    # threads caps the decoders, the filter graph and the encoder alike,
+    # so parallel renders do not oversubscribe the cpu
+    threads = str(threads or 2)
+    inputs = []
+    graph = []
+    labels = []
+    input_index = 0
+    for i, entry in enumerate(timeline.entries):
+        inputs += ["-threads", threads, "-ss", f"{entry.start:.3f}", "-t", f"{entry.duration:.3f}", "-i", entry.source]
+        source_index = input_index
+        input_index += 1
+
+        overlay_index = -1
+        if entry.overlay:
+            inputs += ["-loop", "1", "-t", f"{entry.duration:.3f}", "-i", entry.overlay]
+            overlay_index = input_index
+            input_index += 1
+
+        label = f"v{i}"
+        graph += entry_graph(timeline, entry, source_index, overlay_index, label)
+        labels.append(f"[{label}]")
+
+    video_label = "[vcat]" if timeline.subtitle_file else "[vout]"
+    graph += join_graph(timeline, labels, video_label)
+    if timeline.subtitle_file:
+        subtitles = ffmpeg.subtitles_filter(timeline.subtitle_file, timeline.fonts_dir, timeline.subtitle_style)
+        graph.append(f"[vcat]{subtitles}[vout]")
+
+    duration = timeline.duration
+    args = ["-filter_complex_threads", threads, *inputs]
+    maps = ["-map", "[vout]"]
+    audio_copy = timeline.audio_codec == "copy"
+    if timeline.audio_file and audio_copy:
+        args += ["-i", timeline.audio_file]
+        maps += ["-map", f"{input_index}:a"]
+        input_index += 1
+    elif timeline.audio_file:
+        args += ["-i", timeline.audio_file]
+        graph.append(f"[{input_index}:a]volume={timeline.audio_volume}[voice]")
+        input_index += 1
+        audio_label = "[voice]"
+
+        if timeline.bgm_file:
+            args += ["-stream_loop", "-1", "-i", timeline.bgm_file]
+            graph.append(
+                f"[{input_index}:a]volume={timeline.bgm_volume},atrim=0:{duration:.3f},"
+                f"afade=t=out:st={max(0.0, duration - 3):.3f}:d=3[bgm]"
+            )
+            graph.append("[voice][bgm]amix=inputs=2:duration=longest:dropout_transition=0:normalize=0[aout]")
+            input_index += 1
+            audio_label = "[aout]"
+        maps += ["-map", audio_label]
+
+    args += ["-filter_complex", ";".join(graph), *maps]
+    args += [
+        "-c:v", video_codec,
+        "-pix_fmt", "yuv420p",
+        "-r", str(timeline.fps),
+        "-threads", threads,
+        *(encoder_args or []),
+    ]
+    if timeline.audio_file and audio_copy:
+        args += ["-c:a", "copy"]
+    elif timeline.audio_file:
+        args += ["-c:a", timeline.audio_codec]
+        if audio_bitrate:
+            args += ["-b:a", audio_bitrate]
+    else:
+        args += ["-an"]
+    args += ["-t", f"{duration:.3f}", output_file]
+    return args
+
+
+def render(
+    timeline: Timeline,
+    output_file: str,
+    threads: int = 2,
+    video_codec: str = "libx264",
+    encoder_args: List[str] = None,
+    audio_bitrate: str = "",
+) -> str:
+    logger.info(f"rendering timeline: {len(timeline.entries)} entries, duration: {timeline.duration:.2f}s => {output_file}")
+    ffmpeg.run(
+        compile_timeline(
+            timeline,
+            output_file,
+            threads=threads,
+            video_codec=video_codec,
+            encoder_args=encoder_args,
+            audio_bitrate=audio_bitrate,
+        )
+    )
+    return output_file
@@ -0,0 +1,191 @@
+"""
+Whisper warm pool: a dedicated worker process owns the model, loads it once
+(at startup or on the first request) and serves transcription requests from
+a queue, one at a time.
+"""
+import itertools
+import multiprocessing
+import os
+import threading
+
+from loguru import logger
+
+from app.config import config
+
+
+def enabled() -> bool:
+    return bool(config.whisper.get("worker", False))
+
+
+def _worker(requests, results):
+    # runs in the worker process
+    from app.services import subtitle
+
+    try:
+        loaded = subtitle.load_model() is not None
+    except Exception as e:
+        logger.error(f"failed to load whisper model: {str(e)}")
+        loaded = False
+    results.put(("ready", loaded, None))
+    if not loaded:
+        return
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, audio_file = request
+        try:
+            results.put((request_id, subtitle.run_transcription(audio_file), None))
+        except Exception as e:
+            results.put((request_id, None, str(e)))
+
+
+class TranscriptionService:
+    def __init__(self):
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._requests = None
+        self._ready = threading.Event()
+        self._loaded = False
+        # request id => [done event, transcript, error]
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self._loaded and self.alive
+
+    @property
+    def queue_depth(self) -> int:
+        # requests waiting for or being served by the worker
+        with self._lock:
+            return len(self._pending)
+
+    def start(self) -> bool:
+        """
+        starts the worker if it is not running and waits until the model is loaded
+        """
+        with self._lock:
+            if not self.alive:
+                self._ready.clear()
+                self._loaded = False
+                self._requests = self._context.Queue()
+                results = self._context.Queue()
+                self._process = self._context.Process(
+                    target=_worker,
+                    args=(self._requests, results),
+                    name="whisper-worker",
+                    daemon=True,
+                )
+                self._process.start()
+                threading.Thread(target=self._collect, args=(results,), daemon=True).start()
+                logger.info(f"transcription worker started, pid: {self._process.pid}")
+            process = self._process
+
+        while not self._ready.wait(1.0):
+            if not process.is_alive():
+                logger.error("transcription worker exited while loading the model")
+                return False
+        return self.ready
+
+    def _collect(self, results):
+        while True:
+            try:
+                request_id, transcript, error = results.get()
+            except (EOFError, OSError):
+                break
+
+            if request_id == "ready":
+                self._loaded = transcript
+                self._ready.set()
+                if not transcript:
+                    break
+                logger.info("transcription worker ready")
+                continue
+
+            with self._lock:
+                pending = self._pending.pop(request_id, None)
+                if error:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+            if pending:
+                pending[1], pending[2] = transcript, error
+                pending[0].set()
+
+    def transcribe(self, audio_file: str) -> dict:
+        if not self.start():
+            raise RuntimeError("transcription worker is not ready")
+
+        pending = [threading.Event(), None, None]
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = pending
+            requests, process = self._requests, self._process
+        requests.put((request_id, os.path.abspath(audio_file)))
+
+        while not pending[0].wait(1.0):
+            if not process.is_alive():
+                with self._lock:
+                    self._pending.pop(request_id, None)
+                raise RuntimeError("transcription worker exited")
+
+        if pending[2]:
+            raise RuntimeError(pending[2])
+        return pending[1]
+
+    def stop(self):
+        with self._lock:
+            process, requests = self._process, self._requests
+            self._process = None
+        if process is not None and process.is_alive():
+            requests.put(None)
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+            logger.info("transcription worker stopped")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": enabled(),
+            "alive": self.alive,
+            "ready": self.ready,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "pid": self._process.pid if self._process is not None else None,
+        }
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> TranscriptionService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TranscriptionService()
+        return _service
+
+
+def start() -> bool:
+    # warm-up: load the model before the first task needs it
+    return get_service().start()
+
+
+def stop():
+    if _service is not None:
+        _service.stop()
+
+
+def stats() -> dict:
+    return get_service().stats()
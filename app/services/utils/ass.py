@@ -0,0 +1,130 @@
+import struct
+from typing import List, Tuple
+
+from loguru import logger
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: {width}
+PlayResY: {height}
+WrapStyle: 2
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,{font_name},{font_size},{primary},{primary},{outline},{back},0,0,0,0,100,100,0,0,{border_style},{outline_width},0,{alignment},{margin_h},{margin_h},{margin_v},1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def font_size_scale(font_path: str) -> float:
+    """
+    libass sizes a font by its line height (OS/2 winAscent + winDescent, or the
+    hhea ascender - descender), PIL and moviepy by its em square. an ass
+    Fontsize of font_size * scale renders glyphs as large as PIL does at font_size
+    """
+    try:
+        with open(font_path, "rb") as f:
+            data = f.read()
+        offset = 0
+        if data[:4] == b"ttcf":
+            # font collection: the first font
+            offset = struct.unpack_from(">I", data, 12)[0]
+        table_count = struct.unpack_from(">H", data, offset + 4)[0]
+        tables = {}
+        for i in range(table_count):
+            tag, _, table_offset, _ = struct.unpack_from(">4sIII", data, offset + 12 + i * 16)
+            tables[tag] = table_offset
+
+        units_per_em = struct.unpack_from(">H", data, tables[b"head"] + 18)[0]
+        height = 0
+        if b"OS/2" in tables:
+            win_ascent, win_descent = struct.unpack_from(">HH", data, tables[b"OS/2"] + 74)
+            height = win_ascent + win_descent
+        if not height and b"hhea" in tables:
+            ascender, descender = struct.unpack_from(">hh", data, tables[b"hhea"] + 4)
+            height = ascender - descender
+        if units_per_em and height > 0:
+            return height / units_per_em
+    except Exception as e:
+        logger.warning(f"failed to read font metrics: {font_path}, {str(e)}")
+    return 1.0
+
+
+def color(value, alpha: int = 0) -> str:
+    # "#RRGGBB" => "&HAABBGGRR"
+    value = (value if isinstance(value, str) else "#000000").lstrip("#")
+    if len(value) != 6:
+        value = "000000"
+    return f"&H{alpha:02X}{value[4:6]}{value[2:4]}{value[0:2]}".upper()
+
+
+def timestamp(seconds: float) -> str:
+    centiseconds = int(round(max(0.0, seconds) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    seconds, centiseconds = divmod(centiseconds, 100)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}.{centiseconds:02d}"
+
+
+def escape_text(text: str) -> str:
+    # braces open override blocks in ass
+    text = text.replace("{", "｛").replace("}", "｝")
+    return text.strip().replace("\r", "").replace("\n", "\\N")
+
+
+def write(
+    ass_file: str,
+    subtitles: List[Tuple[float, float, str, str]],
+    width: int,
+    height: int,
+    font_name: str,
+    font_size: int,
+    fore_color: str = "#FFFFFF",
+    stroke_color: str = "#000000",
+    stroke_width: float = 0,
+    background_color=None,
+    alignment: int = 2,
+    margin_v: int = 0,
+) -> str:
+    """
+    subtitles: (start, end, text, override) items, override is an optional
+    ass override block such as "{\\an8\\pos(540,1200)}"
+    """
+    if isinstance(background_color, str) and background_color:
+        # opaque box, libass draws it with the outline colour
+        border_style = 3
+        outline = back = color(background_color)
+        outline_width = max(1.0, font_size * 0.1)
+    else:
+        border_style = 1
+        outline = color(stroke_color)
+        back = color("#000000", alpha=0xFF)
+        outline_width = stroke_width
+
+    lines = [
+        ASS_HEADER.format(
+            width=width,
+            height=height,
+            font_name=font_name,
+            font_size=font_size,
+            primary=color(fore_color),
+            outline=outline,
+            back=back,
+            border_style=border_style,
+            outline_width=outline_width,
+            alignment=alignment,
+            margin_h=int(width * 0.05),
+            margin_v=margin_v,
+        )
+    ]
+    for start, end, text, override in subtitles:
+        lines.append(
+            f"Dialogue: 0,{timestamp(start)},{timestamp(end)},Default,,0,0,0,,{override or ''}{escape_text(text)}\n"
+        )
+
+    with open(ass_file, "w", encoding="utf-8") as f:
+        f.write("".join(lines))
+    return ass_file
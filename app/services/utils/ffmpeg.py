@@ -0,0 +1,113 @@
+import os
+import re
+import subprocess
+from typing import List
+
+from loguru import logger
+
+
+def ffmpeg_binary() -> str:
+    # moviepy already resolves IMAGEIO_FFMPEG_EXE / the bundled imageio binary
+    from moviepy.config import FFMPEG_BINARY
+
+    return FFMPEG_BINARY
+
+
+def run(args: List[str]):
+    cmd = [ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error", "-y", *args]
+    logger.debug(f"ffmpeg: {' '.join(cmd)}")
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        stderr = result.stderr.decode("utf-8", errors="ignore").strip()
+        raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {stderr}")
+    return result
+
+
+def decode_pcm(file: str, sample_rate: int = 44100, channels: int = 2) -> bytes:
+    # interleaved float32 samples of the first audio stream
+    result = run(["-i", file, "-vn", "-ac", str(channels), "-ar", str(sample_rate), "-f", "f32le", "-"])
+    return result.stdout
+
+
+def keyframe_interval(file: str, scan_seconds: float = 30) -> float:
+    """
+    average distance in seconds between keyframes in the first scan_seconds,
+    0 if less than two keyframes were found. only keyframes are decoded
+    """
+    cmd = [
+        ffmpeg_binary(), "-hide_banner", "-nostdin",
+        "-skip_frame", "nokey",
+        "-t", str(scan_seconds),
+        "-i", file,
+        "-an", "-vf", "showinfo",
+        "-f", "null", "-",
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = result.stderr.decode("utf-8", errors="ignore")
+    times = [float(t) for t in re.findall(r"pts_time:\s*([0-9.]+)", stderr)]
+    if len(times) < 2:
+        return 0.0
+    return (times[-1] - times[0]) / (len(times) - 1)
+
+
+def escape_filter_value(value: str) -> str:
+    # for values quoted with '' inside a filter graph, e.g. subtitles=filename='...'
+    value = value.replace("\\", "/")
+    for char in ("'", ":", ",", "[", "]", ";"):
+        value = value.replace(char, "\\" + char)
+    return value
+
+
+def subtitles_filter(subtitle_file: str, fonts_dir: str = "", force_style: str = "") -> str:
+    # libass burn-in, works for srt and ass files
+    value = f"subtitles=filename='{escape_filter_value(subtitle_file)}':charenc=UTF-8"
+    if fonts_dir:
+        value += f":fontsdir='{escape_filter_value(fonts_dir)}'"
+    if force_style:
+        value += f":force_style='{escape_filter_value(force_style)}'"
+    return value
+
+
+def write_concat_list(files: List[str], list_file: str) -> str:
+    with open(list_file, "w", encoding="utf-8") as f:
+        for file in files:
+            file = os.path.abspath(file).replace("\\", "/").replace("'", "'\\''")
+            f.write(f"file '{file}'\n")
+    return list_file
+
+
+def concat(
+    files: List[str],
+    output_file: str,
+    video_codec: str = "libx264",
+    fps: int = 30,
+    threads: int = 2,
+    copy: bool = False,
+    encoder_args: List[str] = None,
+) -> str:
+    """
+    concatenate files with the concat demuxer: every input is decoded once and
+    the output is encoded once, no matter how many clips are joined.
+    with copy=True the packets are copied as-is, which requires all inputs to share
+    the same encoding profile, encoder_args (preset, crf, ...) only apply when re-encoding
+    """
+    list_file = write_concat_list(files, f"{output_file}.txt")
+    args = ["-f", "concat", "-safe", "0", "-i", list_file, "-an"]
+    if copy:
+        args += ["-c:v", "copy"]
+    else:
+        args += [
+            "-c:v", video_codec,
+            "-pix_fmt", "yuv420p",
+            "-r", str(fps),
+            "-threads", str(threads or 2),
+            *(encoder_args or []),
+        ]
+    try:
+        run([*args, output_file])
+    finally:
+        try:
+            os.remove(list_file)
+        except OSError:
+            pass
+    return output_file
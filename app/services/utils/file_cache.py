@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Optional
+
+from loguru import logger
+
+
+def file_identity(file_path: str):
+    # cheap identity of a source file: path + size + modification time
+    stat = os.stat(file_path)
+    return [os.path.realpath(file_path), stat.st_size, stat.st_mtime_ns]
+
+
+def file_digest(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    # content hash, for sources that may be copied or renamed in the media library
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src: str, dst: str):
+    try:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+    return dst
+
+
+class FileCache:
+    """
+    content-addressed file cache with LRU eviction under a byte budget.
+    the modification time of a cached file is its last use, hits touch it
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 0, suffix: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts) -> str:
+        data = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def get(self, key: str) -> Optional[str]:
+        file = self.path(key)
+        with self._lock:
+            if os.path.isfile(file):
+                try:
+                    os.utime(file)
+                except OSError:
+                    pass
+                self.hits += 1
+                return file
+            self.misses += 1
+        return None
+
+    def temp_file(self, key: str, suffix: str = ".tmp") -> str:
+        # unique per call, threads and processes putting the same key never share a temp file.
+        # names ending with .tmp are skipped by evict()
+        fd, temp_file = tempfile.mkstemp(prefix=f"{key}.", suffix=suffix, dir=self.directory)
+        os.close(fd)
+        return temp_file
+
+    def put(self, key: str, file: str) -> str:
+        cached_file = self.path(key)
+        temp_file = self.temp_file(key)
+        try:
+            link_or_copy(file, temp_file)
+            os.replace(temp_file, cached_file)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        self.evict()
+        return cached_file
+
+    def evict(self):
+        if not self.max_bytes:
+            return
+
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if name.endswith(".tmp"):
+                    continue
+                file = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(file)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file))
+                total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            # least recently used first
+            entries.sort()
+            for _, size, file in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(file)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+            logger.debug(f"cache evicted: {self.directory}, size: {total} bytes")
+
+    def stats(self) -> dict:
+        size = 0
+        files = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                size += os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files += 1
+
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "files": files,
+            "bytes": size,
+        }
@@ -0,0 +1,128 @@
+"""
+Lifecycle of moviepy file readers (each one owns an ffmpeg subprocess and its pipes).
+
+clips opened through a ReaderPool are closed deterministically when the pool
+exits, and the module keeps counts of the readers that are currently open,
+so long-running workers can verify that nothing leaks between tasks.
+"""
+import os
+import threading
+from collections import Counter
+
+from loguru import logger
+
+_lock = threading.Lock()
+_open = Counter()
+_opened_total = Counter()
+
+
+def _count(kind: str, delta: int):
+    with _lock:
+        _open[kind] += delta
+        if delta > 0:
+            _opened_total[kind] += delta
+
+
+def open_fds() -> int:
+    # file descriptors of this process, -1 where /proc is not available
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "open_video_readers": _open["video"],
+            "open_audio_readers": _open["audio"],
+            "opened_video_readers": _opened_total["video"],
+            "opened_audio_readers": _opened_total["audio"],
+            "open_fds": open_fds(),
+        }
+
+
+def close_clip(clip):
+    if clip is None:
+        return
+
+    try:
+        # close main resources
+        if getattr(clip, "reader", None) is not None:
+            clip.reader.close()
+
+        # close audio resources
+        if getattr(clip, "audio", None) is not None:
+            if getattr(clip.audio, "reader", None) is not None:
+                clip.audio.reader.close()
+            clip.audio = None
+
+        # close mask resources
+        if getattr(clip, "mask", None) is not None:
+            if getattr(clip.mask, "reader", None) is not None:
+                clip.mask.reader.close()
+            clip.mask = None
+
+        # handle child clips in composite clips
+        for child_clip in getattr(clip, "clips", None) or []:
+            if child_clip is not clip:  # avoid possible circular references
+                close_clip(child_clip)
+
+        # clear clip list
+        if hasattr(clip, "clips"):
+            clip.clips = []
+
+    except Exception as e:
+        logger.error(f"failed to close clip: {str(e)}")
+
+
+class ReaderPool:
+    """
+    opens file clips and closes all of them on exit, in reverse order:
+
+        with ReaderPool() as readers:
+            video_clip = readers.video(video_path, audio=False)
+            audio_clip = readers.audio(audio_path)
+            ...
+    """
+
+    def __init__(self):
+        self._clips = []
+        self._lock = threading.Lock()
+
+    def _track(self, kinds, clip):
+        for kind in kinds:
+            _count(kind, 1)
+        with self._lock:
+            self._clips.append((kinds, clip))
+        return clip
+
+    def video(self, file_path: str, **kwargs):
+        from moviepy.video.io.VideoFileClip import VideoFileClip
+
+        clip = VideoFileClip(file_path, **kwargs)
+        kinds = ["video", "audio"] if clip.audio is not None else ["video"]
+        return self._track(kinds, clip)
+
+    def audio(self, file_path: str, **kwargs):
+        from moviepy.audio.io.AudioFileClip import AudioFileClip
+
+        return self._track(["audio"], AudioFileClip(file_path, **kwargs))
+
+    def close(self):
+        with self._lock:
+            clips, self._clips = self._clips, []
+        for kinds, clip in reversed(clips):
+            close_clip(clip)
+            for kind in kinds:
+                _count(kind, -1)
+
+    def __len__(self):
+        return len(self._clips)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,80 @@
+from typing import List
+
+from loguru import logger
+
+from app.config import config
+
+# built-in profiles, [render_profiles.<name>] in config.toml overrides single values
+DEFAULT_RENDER_PROFILES = {
+    "draft": {
+        "preset": "ultrafast",
+        "crf": 28,
+        "tune": "fastdecode",
+        "keyint": 60,
+        "fps": 30,
+        "audio_bitrate": "96k",
+    },
+    "standard": {
+        "preset": "veryfast",
+        "crf": 23,
+        "tune": "",
+        "keyint": 60,
+        "fps": 30,
+        "audio_bitrate": "128k",
+    },
+    "publish": {
+        "preset": "slow",
+        "crf": 20,
+        "tune": "",
+        "keyint": 60,
+        "fps": 30,
+        "audio_bitrate": "192k",
+    },
+}
+
+
+class RenderProfile:
+    def __init__(self, name, preset="veryfast", crf=23, tune="", keyint=60, fps=30, audio_bitrate="128k"):
+        self.name = name
+        self.preset = preset
+        self.crf = crf
+        self.tune = tune
+        self.keyint = int(keyint)
+        self.fps = int(fps)
+        self.audio_bitrate = audio_bitrate
+
+    def x264_params(self) -> List[str]:
+        # encoder options besides the preset, moviepy takes the preset separately
+        params = ["-crf", str(self.crf), "-g", str(self.keyint)]
+        if self.tune:
+            params += ["-tune", self.tune]
+        return params
+
+    def encoder_args(self) -> List[str]:
+        return ["-preset", self.preset, *self.x264_params()]
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    def __str__(self):
+        return f"RenderProfile(name={self.name}, preset={self.preset}, crf={self.crf}, tune={self.tune}, keyint={self.keyint}, fps={self.fps}, audio_bitrate={self.audio_bitrate})"
+
+
+def profile_names() -> List[str]:
+    return list(dict.fromkeys([*DEFAULT_RENDER_PROFILES, *config.render_profiles]))
+
+
+def get_render_profile(name: str = "") -> RenderProfile:
+    name = (name or config.app.get("render_profile", "standard")).strip().lower()
+    if name not in DEFAULT_RENDER_PROFILES and name not in config.render_profiles:
+        logger.warning(f"unknown render profile: {name}, using standard")
+        name = "standard"
+
+    values = dict(DEFAULT_RENDER_PROFILES.get(name, DEFAULT_RENDER_PROFILES["standard"]))
+    values.update(config.render_profiles.get(name, {}))
+    return RenderProfile(name=name, **values)
+
+
+def get_intermediate_profile() -> RenderProfile:
+    # temp clips and combined videos only live until the final encode
+    return get_render_profile(config.app.get("intermediate_render_profile", "draft"))
@@ -0,0 +1,92 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+from app.services.utils.file_cache import FileCache
+
+
+class SpriteCache:
+    """
+    pre-rendered RGBA bitmaps (e.g. styled subtitle lines), LRU in memory under
+    a byte budget, optionally persisted as .npy files in a FileCache
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, disk_dir: str = "", disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk = FileCache(disk_dir, max_bytes=disk_max_bytes, suffix=".npy") if disk_dir else None
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    key = staticmethod(FileCache.key)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            sprite = self._items.get(key)
+            if sprite is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return sprite
+
+        disk_file = self.disk.get(key) if self.disk else None
+        if disk_file:
+            try:
+                sprite = np.load(disk_file)
+                self._remember(key, sprite)
+                with self._lock:
+                    self.disk_hits += 1
+                return sprite
+            except Exception as e:
+                logger.warning(f"failed to load sprite: {str(e)}")
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, sprite: np.ndarray) -> np.ndarray:
+        sprite.setflags(write=False)
+        self._remember(key, sprite)
+        if self.disk:
+            temp_file = self.disk.temp_file(key)
+            try:
+                with open(temp_file, "wb") as f:
+                    np.save(f, sprite)
+                self.disk.put(key, temp_file)
+            except Exception as e:
+                logger.warning(f"failed to save sprite: {str(e)}")
+            finally:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+        return sprite
+
+    def _remember(self, key: str, sprite: np.ndarray):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return
+            self._items[key] = sprite
+            self.bytes += sprite.nbytes
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+            "evictions": self.evictions,
+            "items": len(self._items),
+            "bytes": self.bytes,
+        }
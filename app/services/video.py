@@ -1,21 +1,21 @@
-import glob
+import functools
 import itertools
+import json
 import os
 import random
-import gc
 import shutil
+import threading
+import numpy as np
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from loguru import logger
-from moviepy.audio.io.AudioFileClip import AudioFileClip
-from moviepy.audio.AudioClip import CompositeAudioClip
-from moviepy.audio.fx import all as afx
-from moviepy.video.io.VideoFileClip import VideoFileClip
-from moviepy.video.VideoClip import ColorClip, TextClip, ImageClip
+from moviepy.video.VideoClip import TextClip, ImageClip
 from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
-from moviepy.video.compositing.concatenate import concatenate_videoclips
-from moviepy.video.tools.subtitles import SubtitlesClip
+from moviepy.video.tools.subtitles import SubtitlesClip, file_to_subtitles
 from PIL import ImageFont
 
+from app.config import config
 from app.models import const
 from app.models.schema import (
     MaterialInfo,
@@ -24,7 +24,13 @@ from app.models.schema import (
     VideoParams,
     VideoTransitionMode,
 )
-from app.services.utils import video_effects
+from app.services import audio_mixer, bgm, media_index, timeline
+from app.services.timeline import Timeline, TimelineEntry
+from app.services.utils import ass, ffmpeg
+from app.services.utils.file_cache import FileCache, file_digest, file_identity, link_or_copy
+from app.services.utils.readers import ReaderPool
+from app.services.utils.render_profile import RenderProfile, get_intermediate_profile, get_render_profile
+from app.services.utils.sprite_cache import SpriteCache
 from app.utils import utils
 
 class SubClippedVideoClip:
@@ -47,42 +53,22 @@ audio_codec = "aac"
 video_codec = "libx264"
 fps = 30
 
-def close_clip(clip):
-    if clip is None:
-        return
-        
-    try:
-        # close main resources
-        if hasattr(clip, 'reader') and clip.reader is not None:
-            clip.reader.close()
-            
-        # close audio resources
-        if hasattr(clip, 'audio') and clip.audio is not None:
-            if hasattr(clip.audio, 'reader') and clip.audio.reader is not None:
-                clip.audio.reader.close()
-            del clip.audio
-            
-        # close mask resources
-        if hasattr(clip, 'mask') and clip.mask is not None:
-            if hasattr(clip.mask, 'reader') and clip.mask.reader is not None:
-                clip.mask.reader.close()
-            del clip.mask
-            
-        # handle child clips in composite clips
-        if hasattr(clip, 'clips') and clip.clips:
-            for child_clip in clip.clips:
-                if child_clip is not clip:  # avoid possible circular references
-                    close_clip(child_clip)
-            
-        # clear clip list
-        if hasattr(clip, 'clips'):
-            clip.clips = []
-            
-    except Exception as e:
-        logger.error(f"failed to close clip: {str(e)}")
-    
-    del clip
-    gc.collect()
+
+def final_render_profile(params: VideoParams = None) -> RenderProfile:
+    # per task profile, falls back to app.render_profile
+    return get_render_profile(getattr(params, "render_profile", "") or "")
+
+
+def intermediate_ffmpeg_params(profile: RenderProfile) -> List[str]:
+    # strict common profile for temp clips (fixed GOP and timebase, the filter graph
+    # already sets yuv420p and SAR 1), so that they can be concatenated with a stream
+    # copy instead of a re-encode
+    return [
+        *profile.encoder_args(),
+        "-keyint_min", str(profile.keyint),
+        "-sc_threshold", "0",
+        "-video_track_timescale", str(profile.fps * 512),
+    ]
 
 def delete_files(files: List[str] | str):
     if isinstance(files, str):
@@ -102,14 +88,309 @@ def get_bgm_file(bgm_type: str = "random", bgm_file: str = ""):
         return bgm_file
 
     if bgm_type == "random":
-        suffix = "*.mp3"
-        song_dir = utils.song_dir()
-        files = glob.glob(os.path.join(song_dir, suffix))
-        return random.choice(files)
+        files = bgm.list_songs()
+        return random.choice(files) if files else ""
 
     return ""
 
 
+def mix_audio(voice_file: str, output_file: str, params: VideoParams) -> str:
+    """
+    voice and bgm mixed into one finished aac track, encoded once per task and
+    muxed with a stream copy into all video_count variants
+    """
+    bgm_file = get_bgm_file(bgm_type=params.bgm_type, bgm_file=params.bgm_file)
+    ducking = getattr(params, "bgm_ducking", None) or config.app.get("bgm_ducking", 0.0)
+    wav_file = f"{os.path.splitext(output_file)[0]}.wav"
+    audio_mixer.mix(
+        voice_file,
+        wav_file,
+        bgm_file=bgm.prepared_file(bgm_file),
+        voice_volume=params.voice_volume,
+        bgm_volume=params.bgm_volume,
+        ducking=float(ducking),
+    )
+    try:
+        profile = final_render_profile(params)
+        ffmpeg.run(["-i", wav_file, "-c:a", audio_codec, "-b:a", profile.audio_bitrate, "-f", "mp4", output_file])
+    finally:
+        delete_files(wav_file)
+    return output_file
+
+
+_clip_cache = None
+
+
+def clip_cache():
+    # rendered subclips shared across tasks, keyed by source identity and render settings
+    global _clip_cache
+    if not config.app.get("clip_cache_enabled", False):
+        return None
+    if _clip_cache is None:
+        _clip_cache = FileCache(
+            utils.cache_dir("clips"),
+            max_bytes=int(config.app.get("clip_cache_max_bytes", 0) or 0),
+            suffix=".mp4",
+        )
+    return _clip_cache
+
+
+_image_clip_cache = None
+# tasks run as threads, the same image clip is rendered once per key
+_image_clip_locks = defaultdict(threading.Lock)
+
+
+def image_clip_cache() -> FileCache:
+    # ken burns clips of image materials, kept out of the media library
+    global _image_clip_cache
+    if _image_clip_cache is None:
+        _image_clip_cache = FileCache(
+            utils.cache_dir("images"),
+            max_bytes=int(config.app.get("image_clip_cache_max_bytes", 0) or 0),
+            suffix=".mp4",
+        )
+    return _image_clip_cache
+
+
+_subtitle_sprite_cache = None
+
+
+def subtitle_sprite_cache() -> SpriteCache:
+    global _subtitle_sprite_cache
+    if _subtitle_sprite_cache is None:
+        disk_dir = utils.cache_dir("subtitles") if config.app.get("subtitle_sprite_cache_disk", False) else ""
+        _subtitle_sprite_cache = SpriteCache(
+            max_bytes=int(config.app.get("subtitle_sprite_cache_max_bytes", 268435456)),
+            disk_dir=disk_dir,
+            disk_max_bytes=int(config.app.get("subtitle_sprite_cache_disk_max_bytes", 1073741824) or 0),
+        )
+    return _subtitle_sprite_cache
+
+
+def clip_render_workers(clip_count: int) -> int:
+    # 0 or unset: one worker per cpu core
+    workers = int(config.app.get("clip_render_workers", 0) or 0) or os.cpu_count() or 1
+    return max(1, min(workers, clip_count))
+
+
+def max_ffmpeg_threads() -> int:
+    # upper bound for the ffmpeg threads (decode, filter, encode) of all clip workers together
+    return int(config.app.get("max_ffmpeg_threads", 0) or 0) or os.cpu_count() or 1
+
+
+def pick_transition(video_transition_mode: VideoTransitionMode = None):
+    # resolve random choices up front, so rendering in a worker is deterministic
+    if video_transition_mode is None:
+        return None, None
+
+    transition = video_transition_mode.value
+    if transition == VideoTransitionMode.shuffle.value:
+        transition = random.choice(
+            [
+                VideoTransitionMode.fade_in.value,
+                VideoTransitionMode.fade_out.value,
+                VideoTransitionMode.slide_in.value,
+                VideoTransitionMode.slide_out.value,
+            ]
+        )
+    if transition == VideoTransitionMode.none.value:
+        return None, None
+
+    # only slides move towards a side, fades keep side=None so equal fade entries share cache and dedup keys
+    if transition not in (VideoTransitionMode.slide_in.value, VideoTransitionMode.slide_out.value):
+        return transition, None
+    shuffle_side = random.choice(["left", "right", "top", "bottom"])
+    return transition, shuffle_side
+
+
+# xfade transitions for the transition modes, slides by the side the clip moves towards
+crossfade_transitions = {
+    VideoTransitionMode.fade_in.value: {None: "fade"},
+    VideoTransitionMode.fade_out.value: {None: "fadeblack"},
+    VideoTransitionMode.slide_in.value: {
+        "left": "slideright",
+        "right": "slideleft",
+        "top": "slidedown",
+        "bottom": "slideup",
+    },
+    VideoTransitionMode.slide_out.value: {
+        "left": "slideleft",
+        "right": "slideright",
+        "top": "slideup",
+        "bottom": "slidedown",
+    },
+}
+
+
+# deprecated names of the render backends
+render_backend_aliases = {"moviepy": "clips", "ffmpeg": "timeline"}
+
+
+def render_backend() -> str:
+    # "timeline": the timeline is compiled into one ffmpeg filter graph, no intermediate files
+    # "clips": every entry is rendered to a (cached) temp clip by ffmpeg, then the clips are merged
+    backend = config.app.get("render_backend", "clips").strip().lower()
+    if backend in render_backend_aliases:
+        logger.warning(f"render_backend = \"{backend}\" is deprecated, use \"{render_backend_aliases[backend]}\"")
+        backend = render_backend_aliases[backend]
+    return backend
+
+
+def transition_engine() -> str:
+    # "clip": fade/slide inside every clip, "xfade": crossfades between neighbouring clips
+    return config.app.get("transition_engine", "clip").strip().lower()
+
+
+def pick_crossfade(video_transition_mode: VideoTransitionMode = None):
+    transition, side = pick_transition(video_transition_mode)
+    if transition is None:
+        return None
+    sides = crossfade_transitions.get(transition, {})
+    return sides.get(side) or sides.get(None)
+
+
+def render_subclip(
+    entry: TimelineEntry,
+    clip_file: str,
+    video_width: int,
+    video_height: int,
+    stream_copy: bool = False,
+    threads: int = 1,
+    profile: RenderProfile = None,
+):
+    # runs in a worker thread, the work happens in one ffmpeg subprocess.
+    # scaling, letterboxing and transitions run in ffmpeg's filter graph (scale+pad),
+    # the frames never pass through python
+    logger.debug(f"processing clip: {entry}")
+    profile = profile or get_intermediate_profile()
+    try:
+        clip_timeline = Timeline(width=video_width, height=video_height, fps=profile.fps, entries=[entry])
+        encoder_args = intermediate_ffmpeg_params(profile) if stream_copy else profile.encoder_args()
+        ffmpeg.run(
+            timeline.compile_timeline(
+                clip_timeline,
+                clip_file,
+                threads=threads,
+                video_codec=video_codec,
+                encoder_args=encoder_args,
+            )
+        )
+        return SubClippedVideoClip(file_path=clip_file, duration=entry.duration, width=video_width, height=video_height)
+
+    except Exception as e:
+        logger.error(f"failed to process clip: {str(e)}")
+        return None
+
+
+def split_subclips(video_path: str, video_concat_mode: VideoConcatMode, max_clip_duration: int = 5) -> List[SubClippedVideoClip]:
+    # a file that cannot be probed is skipped in every concat mode
+    try:
+        media_info = media_index.get(video_path)
+    except Exception as e:
+        logger.error(f"failed to probe video: {video_path}, {str(e)}")
+        return []
+    clip_duration = media_info.duration
+    clip_w, clip_h = media_info.width, media_info.height
+    if clip_w < 480 or clip_h < 480:
+        logger.warning(f"low resolution material: {video_path}, {clip_w}x{clip_h}, minimum 480x480 required")
+
+    items = []
+    start_time = 0
+    while start_time < clip_duration:
+        end_time = min(start_time + max_clip_duration, clip_duration)
+        if clip_duration - start_time >= max_clip_duration:
+            items.append(SubClippedVideoClip(file_path=video_path, start_time=start_time, end_time=end_time, width=clip_w, height=clip_h))
+        start_time = end_time
+        if video_concat_mode.value == VideoConcatMode.sequential.value:
+            break
+    return items
+
+
+def plan_subclips(video_paths: List[str], video_concat_mode: VideoConcatMode, max_clip_duration: int = 5):
+    """
+    yields subclip candidates on demand, a video file is probed only when the
+    consumer asks for more clips than the already probed files can provide.
+
+    sequential: the first segment of every file, in the given order.
+    random: files in random order, one random segment per file and round,
+    so the first rounds already mix as many sources as possible.
+    """
+    if video_concat_mode.value == VideoConcatMode.sequential.value:
+        for video_path in video_paths:
+            yield from split_subclips(video_path, video_concat_mode, max_clip_duration)
+        return
+
+    video_paths = list(video_paths)
+    random.shuffle(video_paths)
+
+    probed = []
+    for video_path in video_paths:
+        items = split_subclips(video_path, video_concat_mode, max_clip_duration)
+        random.shuffle(items)
+        if items:
+            yield items.pop()
+        if items:
+            probed.append(items)
+
+    while probed:
+        for items in probed:
+            yield items.pop()
+        probed = [items for items in probed if items]
+
+
+def build_timeline(
+    video_paths: List[str],
+    audio_duration: float,
+    video_aspect: VideoAspect = VideoAspect.portrait,
+    video_concat_mode: VideoConcatMode = VideoConcatMode.random,
+    video_transition_mode: VideoTransitionMode = None,
+    max_clip_duration: int = 5,
+    fps: int = fps,
+    engine: str = "",
+) -> Timeline:
+    aspect = VideoAspect(video_aspect)
+    video_width, video_height = aspect.to_resolution()
+    video_timeline = Timeline(width=video_width, height=video_height, fps=fps)
+
+    # Add downloaded clips over and over until the duration of the audio (max_duration) has been reached,
+    # inputs are only probed while the plan still needs more clips
+    planner = plan_subclips(video_paths, video_concat_mode, max_clip_duration)
+    crossfade = (engine or transition_engine()) == "xfade"
+    crossfade_duration = float(config.app.get("transition_duration", 1.0))
+    while video_timeline.duration <= audio_duration:
+        subclipped_item = next(planner, None)
+        if subclipped_item is None:
+            break
+        entry = TimelineEntry(
+            source=subclipped_item.file_path,
+            start=subclipped_item.start_time,
+            end=subclipped_item.start_time + min(subclipped_item.duration, max_clip_duration),
+        )
+        if not crossfade:
+            entry.transition, entry.side = pick_transition(video_transition_mode)
+        elif video_timeline.entries:
+            entry.xfade = pick_crossfade(video_transition_mode)
+            if entry.xfade:
+                # at most half of either clip, so neighbouring crossfades never overlap
+                previous = video_timeline.entries[-1]
+                entry.xfade_duration = min(crossfade_duration, previous.duration / 2, entry.duration / 2)
+        video_timeline.append(entry)
+    planner.close()
+
+    # loop the planned entries until the timeline matches or exceeds the audio duration.
+    base_entries = list(video_timeline.entries)
+    if base_entries and video_timeline.duration < audio_duration:
+        logger.warning(f"video duration ({video_timeline.duration:.2f}s) is shorter than audio duration ({audio_duration:.2f}s), looping clips to match audio length.")
+        for entry in itertools.cycle(base_entries):
+            if video_timeline.duration >= audio_duration:
+                break
+            video_timeline.append(TimelineEntry.from_dict(entry.to_dict()))
+        logger.info(f"video duration: {video_timeline.duration:.2f}s, audio duration: {audio_duration:.2f}s, looped {len(video_timeline.entries)-len(base_entries)} clips")
+
+    logger.debug(f"timeline entries: {len(video_timeline.entries)}, duration: {video_timeline.duration:.2f}s")
+    return video_timeline
+
+
 def combine_videos(
     combined_video_path: str,
     video_paths: List[str],
@@ -120,113 +401,171 @@ def combine_videos(
     max_clip_duration: int = 5,
     threads: int = 2,
 ) -> str:
-    audio_clip = AudioFileClip(audio_file)
-    audio_duration = audio_clip.duration
+    with ReaderPool() as readers:
+        audio_duration = readers.audio(audio_file).duration
     logger.info(f"audio duration: {audio_duration} seconds")
-    # Required duration of each clip
-    req_dur = audio_duration / len(video_paths)
-    req_dur = max_clip_duration
-    logger.info(f"maximum clip duration: {req_dur} seconds")
+    logger.info(f"maximum clip duration: {max_clip_duration} seconds")
+
+    # the combined video is decoded again for the final encode, a fast profile is enough
+    profile = get_intermediate_profile()
+    video_timeline = build_timeline(
+        video_paths=video_paths,
+        audio_duration=audio_duration,
+        video_aspect=video_aspect,
+        video_concat_mode=video_concat_mode,
+        video_transition_mode=video_transition_mode,
+        max_clip_duration=max_clip_duration,
+        fps=profile.fps,
+    )
+    # keep the timeline next to the output for debugging and re-rendering
+    video_timeline.save(f"{os.path.splitext(combined_video_path)[0]}.timeline.json")
+
+    if not video_timeline.entries:
+        logger.warning("no clips available for merging")
+        return combined_video_path
+
+    has_crossfades = any(entry.xfade for entry in video_timeline.entries)
+    if render_backend() == "timeline" or has_crossfades:
+        # crossfades blend neighbouring clips, they only exist in the single filter graph
+        timeline.render(
+            video_timeline,
+            combined_video_path,
+            threads=threads,
+            video_codec=video_codec,
+            encoder_args=profile.encoder_args(),
+        )
+    else:
+        render_timeline_clips(video_timeline, combined_video_path, audio_duration, threads=threads, profile=profile)
+
+    logger.info("video combining completed")
+    return combined_video_path
+
+
+def unique_entries(entries: List[TimelineEntry]):
+    # returns the distinct entries and, for every input entry, the index of its distinct entry
+    keys = {}
+    indexes = []
+    for entry in entries:
+        entry_key = json.dumps(entry.to_dict(), sort_keys=True)
+        indexes.append(keys.setdefault(entry_key, len(keys)))
+    return [TimelineEntry.from_dict(json.loads(entry_key)) for entry_key in keys], indexes
+
+
+def render_segments(
+    entries: List[TimelineEntry],
+    output_dir: str,
+    video_width: int,
+    video_height: int,
+    profile: RenderProfile,
+    stream_copy: bool = False,
+    prefix: str = "temp-clip",
+) -> List[SubClippedVideoClip]:
+    """
+    renders every entry to its own file, using the clip cache; None for entries that failed.
+    clips are independent, so they are rendered by parallel ffmpeg processes; results keep the order
+    """
+    workers = clip_render_workers(len(entries))
+    clip_threads = max(1, max_ffmpeg_threads() // workers)
+    logger.info(f"rendering {len(entries)} clips, workers: {workers}, threads per clip: {clip_threads}")
+
+    cache = clip_cache()
+    results = [None] * len(entries)
+    pending = []
+    for i, entry in enumerate(entries):
+        clip_file = f"{output_dir}/{prefix}-{i+1}.mp4"
+
+        cache_key = None
+        if cache:
+            cache_key = cache.key(
+                file_identity(entry.source),
+                entry.start,
+                entry.end,
+                entry.fit,
+                video_width,
+                video_height,
+                entry.transition,
+                entry.side,
+                video_codec,
+                profile.to_dict(),
+                stream_copy,
+            )
+            cached_file = cache.get(cache_key)
+            if cached_file:
+                link_or_copy(cached_file, clip_file)
+                results[i] = SubClippedVideoClip(
+                    file_path=clip_file,
+                    duration=entry.duration,
+                    width=video_width,
+                    height=video_height,
+                )
+                continue
+
+        pending.append(
+            (
+                i,
+                cache_key,
+                (entry, clip_file, video_width, video_height, stream_copy, clip_threads, profile),
+            )
+        )
+
+    if workers == 1 or len(pending) <= 1:
+        rendered = [render_subclip(*args) for _, _, args in pending]
+    else:
+        # every task only waits on its ffmpeg subprocess, threads are enough
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="clip-render") as executor:
+            futures = [executor.submit(render_subclip, *args) for _, _, args in pending]
+            rendered = [future.result() for future in futures]
+
+    for (i, cache_key, _), processed_clip in zip(pending, rendered):
+        results[i] = processed_clip
+        if cache and cache_key and processed_clip:
+            try:
+                cache.put(cache_key, processed_clip.file_path)
+            except Exception as e:
+                logger.warning(f"failed to cache clip: {str(e)}")
+
+    if cache:
+        logger.info(f"clip cache: {cache.stats()}")
+    return results
+
+
+def render_timeline_clips(
+    video_timeline: Timeline,
+    combined_video_path: str,
+    audio_duration: float,
+    threads: int = 2,
+    profile: RenderProfile = None,
+) -> str:
     output_dir = os.path.dirname(combined_video_path)
+    profile = profile or get_intermediate_profile()
 
-    aspect = VideoAspect(video_aspect)
-    video_width, video_height = aspect.to_resolution()
+    # "copy": temp clips share one encoding profile and are joined without re-encoding
+    # "encode": temp clips are re-encoded once while merging
+    merge_mode = config.app.get("video_merge_mode", "encode").strip().lower()
+    stream_copy = merge_mode == "copy"
+
+    # looped entries are rendered once
+    entries, entry_indexes = unique_entries(video_timeline.entries)
+    results = render_segments(
+        entries,
+        output_dir,
+        video_timeline.width,
+        video_timeline.height,
+        profile,
+        stream_copy=stream_copy,
+    )
 
     processed_clips = []
-    subclipped_items = []
     video_duration = 0
-    for video_path in video_paths:
-        clip = VideoFileClip(video_path)
-        clip_duration = clip.duration
-        clip_w, clip_h = clip.size
-        close_clip(clip)
-        
-        start_time = 0
-
-        while start_time < clip_duration:
-            end_time = min(start_time + max_clip_duration, clip_duration)            
-            if clip_duration - start_time >= max_clip_duration:
-                subclipped_items.append(SubClippedVideoClip(file_path= video_path, start_time=start_time, end_time=end_time, width=clip_w, height=clip_h))
-            start_time = end_time    
-            if video_concat_mode.value == VideoConcatMode.sequential.value:
-                break
-
-    # random subclipped_items order
-    if video_concat_mode.value == VideoConcatMode.random.value:
-        random.shuffle(subclipped_items)
-        
-    logger.debug(f"total subclipped items: {len(subclipped_items)}")
-    
-    # Add downloaded clips over and over until the duration of the audio (max_duration) has been reached
-    for i, subclipped_item in enumerate(subclipped_items):
-        if video_duration > audio_duration:
-            break
-        
-        logger.debug(f"processing clip {i+1}: {subclipped_item.width}x{subclipped_item.height}, current duration: {video_duration:.2f}s, remaining: {audio_duration - video_duration:.2f}s")
-        
-        try:
-            clip = VideoFileClip(subclipped_item.file_path).subclipped(subclipped_item.start_time, subclipped_item.end_time)
-            clip_duration = clip.duration
-            # Not all videos are same size, so we need to resize them
-            clip_w, clip_h = clip.size
-            if clip_w != video_width or clip_h != video_height:
-                clip_ratio = clip.w / clip.h
-                video_ratio = video_width / video_height
-                logger.debug(f"resizing clip, source: {clip_w}x{clip_h}, ratio: {clip_ratio:.2f}, target: {video_width}x{video_height}, ratio: {video_ratio:.2f}")
-                
-                if clip_ratio == video_ratio:
-                    clip = clip.resized(new_size=(video_width, video_height))
-                else:
-                    if clip_ratio > video_ratio:
-                        scale_factor = video_width / clip_w
-                    else:
-                        scale_factor = video_height / clip_h
-
-                    new_width = int(clip_w * scale_factor)
-                    new_height = int(clip_h * scale_factor)
-
-                    background = ColorClip(size=(video_width, video_height), color=(0, 0, 0)).with_duration(clip_duration)
-                    clip_resized = clip.resized(new_size=(new_width, new_height)).with_position("center")
-                    clip = CompositeVideoClip([background, clip_resized])
-                    
-            shuffle_side = random.choice(["left", "right", "top", "bottom"])
-            if video_transition_mode.value == VideoTransitionMode.none.value:
-                clip = clip
-            elif video_transition_mode.value == VideoTransitionMode.fade_in.value:
-                clip = video_effects.fadein_transition(clip, 1)
-            elif video_transition_mode.value == VideoTransitionMode.fade_out.value:
-                clip = video_effects.fadeout_transition(clip, 1)
-            elif video_transition_mode.value == VideoTransitionMode.slide_in.value:
-                clip = video_effects.slidein_transition(clip, 1, shuffle_side)
-            elif video_transition_mode.value == VideoTransitionMode.slide_out.value:
-                clip = video_effects.slideout_transition(clip, 1, shuffle_side)
-            elif video_transition_mode.value == VideoTransitionMode.shuffle.value:
-                transition_funcs = [
-                    lambda c: video_effects.fadein_transition(c, 1),
-                    lambda c: video_effects.fadeout_transition(c, 1),
-                    lambda c: video_effects.slidein_transition(c, 1, shuffle_side),
-                    lambda c: video_effects.slideout_transition(c, 1, shuffle_side),
-                ]
-                shuffle_transition = random.choice(transition_funcs)
-                clip = shuffle_transition(clip)
-
-            if clip.duration > max_clip_duration:
-                clip = clip.subclipped(0, max_clip_duration)
-                
-            # wirte clip to temp file
-            clip_file = f"{output_dir}/temp-clip-{i+1}.mp4"
-            clip.write_videofile(clip_file, logger=None, fps=fps, codec=video_codec)
-            
-            close_clip(clip)
-        
-            processed_clips.append(SubClippedVideoClip(file_path=clip_file, duration=clip.duration, width=clip_w, height=clip_h))
-            video_duration += clip.duration
-            
-        except Exception as e:
-            logger.error(f"failed to process clip: {str(e)}")
+    for index in entry_indexes:
+        processed_clip = results[index]
+        if processed_clip is None:
+            continue
+        processed_clips.append(processed_clip)
+        video_duration += processed_clip.duration
     
     # loop processed clips until the video duration matches or exceeds the audio duration.
-    if video_duration < audio_duration:
+    if processed_clips and video_duration < audio_duration:
         logger.warning(f"video duration ({video_duration:.2f}s) is shorter than audio duration ({audio_duration:.2f}s), looping clips to match audio length.")
         base_clips = processed_clips.copy()
         for clip in itertools.cycle(base_clips):
@@ -236,75 +575,77 @@ def combine_videos(
             video_duration += clip.duration
         logger.info(f"video duration: {video_duration:.2f}s, audio duration: {audio_duration:.2f}s, looped {len(processed_clips)-len(base_clips)} clips")
      
-    # merge video clips progressively, avoid loading all videos at once to avoid memory overflow
+    # merge all video clips in a single pass
     logger.info("starting clip merging process")
     if not processed_clips:
         logger.warning("no clips available for merging")
         return combined_video_path
     
+    clip_files = [clip.file_path for clip in processed_clips]
+
     # if there is only one clip, use it directly
     if len(processed_clips) == 1:
         logger.info("using single clip directly")
-        shutil.copy(processed_clips[0].file_path, combined_video_path)
-        delete_files(processed_clips)
-        logger.info("video combining completed")
-        return combined_video_path
-    
-    # create initial video file as base
-    base_clip_path = processed_clips[0].file_path
-    temp_merged_video = f"{output_dir}/temp-merged-video.mp4"
-    temp_merged_next = f"{output_dir}/temp-merged-next.mp4"
-    
-    # copy first clip as initial merged video
-    shutil.copy(base_clip_path, temp_merged_video)
-    
-    # merge remaining video clips one by one
-    for i, clip in enumerate(processed_clips[1:], 1):
-        logger.info(f"merging clip {i}/{len(processed_clips)-1}, duration: {clip.duration:.2f}s")
-        
-        try:
-            # load current base video and next clip to merge
-            base_clip = VideoFileClip(temp_merged_video)
-            next_clip = VideoFileClip(clip.file_path)
-            
-            # merge these two clips
-            merged_clip = concatenate_videoclips([base_clip, next_clip])
-
-            # save merged result to temp file
-            merged_clip.write_videofile(
-                filename=temp_merged_next,
-                threads=threads,
-                logger=None,
-                temp_audiofile_path=output_dir,
-                audio_codec=audio_codec,
-                fps=fps,
-            )
-            close_clip(base_clip)
-            close_clip(next_clip)
-            close_clip(merged_clip)
-            
-            # replace base file with new merged file
-            delete_files(temp_merged_video)
-            os.rename(temp_merged_next, temp_merged_video)
-            
-        except Exception as e:
-            logger.error(f"failed to merge clip: {str(e)}")
-            continue
-    
-    # after merging, rename final result to target file name
-    os.rename(temp_merged_video, combined_video_path)
+        shutil.copy(clip_files[0], combined_video_path)
+    else:
+        logger.info(f"merging {len(clip_files)} clips, total duration: {video_duration:.2f}s")
+        merge_clips(clip_files, combined_video_path, threads=threads, copy=stream_copy, profile=profile)
     
     # clean temp files
-    clip_files = [clip.file_path for clip in processed_clips]
-    delete_files(clip_files)
-            
-    logger.info("video combining completed")
+    delete_files(list(dict.fromkeys(clip_files)))
     return combined_video_path
 
 
+def merge_clips(
+    clip_files: List[str],
+    output_file: str,
+    threads: int = 2,
+    copy: bool = False,
+    profile: RenderProfile = None,
+) -> str:
+    # one concat-demuxer pass instead of re-encoding the growing merged file for every clip,
+    # so the merge cost grows linearly with the number of clips.
+    # copy=True expects clips written with intermediate_ffmpeg_params()
+    profile = profile or get_intermediate_profile()
+    return ffmpeg.concat(
+        clip_files,
+        output_file,
+        video_codec=video_codec,
+        fps=profile.fps,
+        threads=threads,
+        copy=copy,
+        encoder_args=profile.encoder_args(),
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def get_font(font: str, fontsize: int) -> ImageFont.FreeTypeFont:
+    # loading a font file is expensive, share the font objects process-wide
+    return ImageFont.truetype(font, fontsize)
+
+
+def break_lines(runs: List[str], widths: List[float], max_width: float, separator: str = "", separator_width: float = 0):
+    # greedy line breaking over pre-measured runs (words or characters), each run is measured once
+    lines = []
+    line = []
+    line_width = 0
+    for run, run_width in zip(runs, widths):
+        next_width = line_width + (separator_width if line else 0) + run_width
+        if line and next_width > max_width:
+            lines.append(separator.join(line))
+            line = [run]
+            line_width = run_width
+        else:
+            line.append(run)
+            line_width = next_width
+    if line:
+        lines.append(separator.join(line))
+    return lines
+
+
 def wrap_text(text, max_width, font="Arial", fontsize=60):
     # Create ImageFont
-    font = ImageFont.truetype(font, fontsize)
+    font = get_font(font, fontsize)
 
     def get_text_size(inner_text):
         inner_text = inner_text.strip()
@@ -315,42 +656,22 @@ def wrap_text(text, max_width, font="Arial", fontsize=60):
     if width <= max_width:
         return text, height
 
-    processed = True
-
-    _wrapped_lines_ = []
-    words = text.split(" ")
-    _txt_ = ""
-    for word in words:
-        _before = _txt_
-        _txt_ += f"{word} "
-        _width, _height = get_text_size(_txt_)
-        if _width <= max_width:
-            continue
-        else:
-            if _txt_.strip() == word.strip():
-                processed = False
-                break
-            _wrapped_lines_.append(_before)
-            _txt_ = f"{word} "
-    _wrapped_lines_.append(_txt_)
-    if processed:
-        _wrapped_lines_ = [line.strip() for line in _wrapped_lines_]
+    words = [word for word in text.split(" ") if word]
+    word_widths = [font.getlength(word) for word in words]
+    if words and max(word_widths) <= max_width:
+        _wrapped_lines_ = break_lines(words, word_widths, max_width, " ", font.getlength(" "))
         result = "\n".join(_wrapped_lines_).strip()
         height = len(_wrapped_lines_) * height
         return result, height
 
-    _wrapped_lines_ = []
+    # a single word is wider than a line (e.g. korean/chinese text without spaces), break between characters
     chars = list(text)
-    _txt_ = ""
-    for word in chars:
-        _txt_ += word
-        _width, _height = get_text_size(_txt_)
-        if _width <= max_width:
-            continue
-        else:
-            _wrapped_lines_.append(_txt_)
-            _txt_ = ""
-    _wrapped_lines_.append(_txt_)
+    char_widths = {}
+    for char in chars:
+        if char not in char_widths:
+            char_widths[char] = font.getlength(char)
+    _wrapped_lines_ = break_lines(chars, [char_widths[char] for char in chars], max_width)
+    _wrapped_lines_ = [line.strip() for line in _wrapped_lines_]
     result = "\n".join(_wrapped_lines_).strip()
     height = len(_wrapped_lines_) * height
     return result, height
@@ -362,6 +683,7 @@ def generate_video(
     subtitle_path: str,
     output_file: str,
     params: VideoParams,
+    mixed_audio_path: str = "",
 ):
     aspect = VideoAspect(params.video_aspect)
     video_width, video_height = aspect.to_resolution()
@@ -372,16 +694,12 @@ def generate_video(
     logger.info(f"  ③ subtitle: {subtitle_path}")
     logger.info(f"  ④ output: {output_file}")
     
-    output_dir = os.path.dirname(output_file)
+    if not mixed_audio_path:
+        mixed_audio_path = mix_audio(audio_path, f"{os.path.splitext(output_file)[0]}-audio.m4a", params)
 
     font_path = ""
     if params.subtitle_enabled:
-        if not params.font_name:
-            params.font_name = "STHeitiMedium.ttc"
-        font_path = os.path.join(utils.font_dir(), params.font_name)
-        if os.name == "nt":
-            font_path = font_path.replace("\\", "/")
-
+        font_path = subtitle_font_path(params)
         logger.info(f"  ⑤ font: {font_path}")
 
     def create_text_clip(subtitle_item):
@@ -389,23 +707,40 @@ def generate_video(
         params.stroke_width = int(params.stroke_width)
         phrase = subtitle_item[1]
         max_width = video_width * 0.9
-        wrapped_txt, txt_height = wrap_text(
-            phrase, max_width=max_width, font=font_path, fontsize=params.font_size
-        )
-        interline = int(params.font_size * 0.25)
-        size=(int(max_width), int(txt_height + params.font_size * 0.25 + (interline * (wrapped_txt.count("\n") + 1))))
 
-        _clip = TextClip(
-            text=wrapped_txt,
-            font=font_path,
-            font_size=params.font_size,
-            color=params.text_fore_color,
-            bg_color=params.text_background_color,
-            stroke_color=params.stroke_color,
-            stroke_width=params.stroke_width,
-            # interline=interline,
-            # size=size,
+        # identical styled lines (disclaimers, coin names, video_count variants) are rasterized once
+        cache = subtitle_sprite_cache()
+        sprite_key = cache.key(
+            phrase,
+            font_path,
+            params.font_size,
+            params.text_fore_color,
+            params.text_background_color,
+            params.stroke_color,
+            params.stroke_width,
+            int(max_width),
         )
+        sprite = cache.get(sprite_key)
+        if sprite is None:
+            wrapped_txt, txt_height = wrap_text(
+                phrase, max_width=max_width, font=font_path, fontsize=params.font_size
+            )
+            text_clip = TextClip(
+                text=wrapped_txt,
+                font=font_path,
+                font_size=params.font_size,
+                color=params.text_fore_color,
+                bg_color=params.text_background_color,
+                stroke_color=params.stroke_color,
+                stroke_width=params.stroke_width,
+            )
+            alpha = text_clip.mask.img if text_clip.mask is not None else np.ones(text_clip.img.shape[:2])
+            sprite = cache.put(
+                sprite_key,
+                np.dstack([text_clip.img, (alpha * 255).astype("uint8")]).astype("uint8"),
+            )
+
+        _clip = ImageClip(sprite, transparent=True)
         duration = subtitle_item[0][1] - subtitle_item[0][0]
         _clip = _clip.with_start(subtitle_item[0][0])
         _clip = _clip.with_end(subtitle_item[0][1])
@@ -428,11 +763,6 @@ def generate_video(
             _clip = _clip.with_position(("center", "center"))
         return _clip
 
-    video_clip = VideoFileClip(video_path).without_audio()
-    audio_clip = AudioFileClip(audio_path).with_effects(
-        [afx.MultiplyVolume(params.voice_volume)]
-    )
-
     def make_textclip(text):
         return TextClip(
             text=text,
@@ -440,85 +770,416 @@ def generate_video(
             font_size=params.font_size,
         )
 
-    if subtitle_path and os.path.exists(subtitle_path):
-        sub = SubtitlesClip(
-            subtitles=subtitle_path, encoding="utf-8", make_textclip=make_textclip
+    # every reader opened here is closed when the block exits, also on errors
+    with ReaderPool() as readers:
+        # the combined video is silent, don't open an audio reader for it
+        video_clip = readers.video(video_path, audio=False)
+        # voice and bgm are already mixed and encoded, the track is muxed with a stream copy
+        audio_duration = readers.audio(mixed_audio_path).duration
+        if video_clip.duration > audio_duration:
+            video_clip = video_clip.subclipped(0, audio_duration)
+
+        # "ass": libass burns the subtitles in while ffmpeg encodes, no per-frame compositing in python
+        # "moviepy": one TextClip per subtitle line, composited over the video
+        subtitle_renderer = config.app.get("subtitle_renderer", "moviepy").strip().lower()
+        ffmpeg_params = None
+        if subtitle_path and os.path.exists(subtitle_path) and subtitle_renderer == "ass":
+            ass_file = write_ass_subtitles(
+                subtitle_path,
+                f"{os.path.splitext(output_file)[0]}.ass",
+                params,
+                video_width,
+                video_height,
+            )
+            ffmpeg_params = ["-vf", ffmpeg.subtitles_filter(ass_file, fonts_dir=utils.font_dir())]
+        elif subtitle_path and os.path.exists(subtitle_path):
+            sub = SubtitlesClip(
+                subtitles=subtitle_path, encoding="utf-8", make_textclip=make_textclip
+            )
+            text_clips = []
+            for item in sub.subtitles:
+                clip = create_text_clip(subtitle_item=item)
+                text_clips.append(clip)
+            logger.debug(f"subtitle sprite cache: {subtitle_sprite_cache().stats()}")
+            video_clip = CompositeVideoClip([video_clip, *text_clips])
+
+        profile = final_render_profile(params)
+        logger.info(f"render profile: {profile}")
+        video_clip.write_videofile(
+            output_file,
+            codec=video_codec,
+            audio=mixed_audio_path,
+            audio_codec="copy",
+            preset=profile.preset,
+            threads=params.n_threads or 2,
+            logger=None,
+            fps=profile.fps,
+            ffmpeg_params=[*profile.x264_params(), *(ffmpeg_params or [])],
         )
-        text_clips = []
-        for item in sub.subtitles:
-            clip = create_text_clip(subtitle_item=item)
-            text_clips.append(clip)
-        video_clip = CompositeVideoClip([video_clip, *text_clips])
 
-    bgm_file = get_bgm_file(bgm_type=params.bgm_type, bgm_file=params.bgm_file)
-    if bgm_file:
+
+def subtitle_font_path(params: VideoParams) -> str:
+    if not params.font_name:
+        params.font_name = "STHeitiMedium.ttc"
+    font_path = os.path.join(utils.font_dir(), params.font_name)
+    if os.name == "nt":
+        font_path = font_path.replace("\\", "/")
+    return font_path
+
+
+def subtitle_font_name(font_path: str) -> str:
+    # libass looks fonts up by family name
+    try:
+        return ImageFont.truetype(font_path, 10).getname()[0]
+    except Exception as e:
+        logger.warning(f"failed to read font name: {str(e)}")
+        return os.path.splitext(os.path.basename(font_path))[0]
+
+
+def write_ass_subtitles(subtitle_path: str, ass_file: str, params: VideoParams, video_width: int, video_height: int) -> str:
+    """
+    converts the srt file and the subtitle style of the params into an ass file,
+    so that ffmpeg/libass can burn the subtitles in while encoding
+    """
+    font_path = subtitle_font_path(params)
+    font_size = int(params.font_size)
+    max_width = video_width * 0.9
+
+    alignment = 2
+    margin_v = int(video_height * 0.05)
+    if params.subtitle_position == "top":
+        alignment = 8
+    elif params.subtitle_position in ("center", "custom"):
+        alignment = 5
+        margin_v = 0
+
+    items = []
+    for (start_time, end_time), phrase in file_to_subtitles(subtitle_path, encoding="utf-8"):
         try:
-            bgm_clip = AudioFileClip(bgm_file).with_effects(
-                [
-                    afx.MultiplyVolume(params.bgm_volume),
-                    afx.AudioFadeOut(3),
-                    afx.AudioLoop(duration=video_clip.duration),
-                ]
-            )
-            audio_clip = CompositeAudioClip([audio_clip, bgm_clip])
+            wrapped_txt, txt_height = wrap_text(phrase, max_width=max_width, font=font_path, fontsize=font_size)
         except Exception as e:
-            logger.error(f"failed to add bgm: {str(e)}")
+            logger.warning(f"failed to wrap subtitle: {str(e)}")
+            wrapped_txt, txt_height = phrase, font_size
 
-    video_clip = video_clip.with_audio(audio_clip)
-    video_clip.write_videofile(
+        override = ""
+        if params.subtitle_position == "custom":
+            # Ensure the subtitle is fully within the screen bounds
+            margin = 10
+            max_y = video_height - txt_height - margin
+            custom_y = (video_height - txt_height) * (params.custom_position / 100)
+            custom_y = max(margin, min(custom_y, max_y))
+            override = f"{{\\an8\\pos({video_width // 2},{int(custom_y)})}}"
+        items.append((start_time, end_time, wrapped_txt, override))
+
+    return ass.write(
+        ass_file,
+        items,
+        width=video_width,
+        height=video_height,
+        font_name=subtitle_font_name(font_path),
+        # libass measures the size as line height, PIL as em size
+        font_size=round(font_size * ass.font_size_scale(font_path), 1),
+        fore_color=params.text_fore_color,
+        stroke_color=params.stroke_color,
+        stroke_width=float(params.stroke_width),
+        background_color=params.text_background_color,
+        alignment=alignment,
+        margin_v=margin_v,
+    )
+
+
+def generate_fused_video(
+    video_paths: List[str],
+    audio_path: str,
+    subtitle_path: str,
+    output_file: str,
+    params: VideoParams,
+    mixed_audio_path: str = "",
+) -> str:
+    """
+    renders the final video straight from the subclip plan: clips, subtitles
+    and the mixed voice/bgm track in a single encode, without the intermediate
+    combined video
+    """
+    if not mixed_audio_path:
+        mixed_audio_path = mix_audio(audio_path, f"{os.path.splitext(output_file)[0]}-audio.m4a", params)
+    with ReaderPool() as readers:
+        audio_duration = readers.audio(mixed_audio_path).duration
+    logger.info(f"generating fused video, audio duration: {audio_duration:.2f}s => {output_file}")
+
+    profile = final_render_profile(params)
+    logger.info(f"render profile: {profile}")
+    video_timeline = build_timeline(
+        video_paths=video_paths,
+        audio_duration=audio_duration,
+        video_aspect=params.video_aspect,
+        video_concat_mode=params.video_concat_mode,
+        video_transition_mode=params.video_transition_mode,
+        max_clip_duration=params.video_clip_duration,
+        fps=profile.fps,
+    )
+    if not video_timeline.entries:
+        logger.warning("no clips available for rendering")
+        return ""
+
+    video_timeline.trim(audio_duration)
+    video_timeline.audio_file = mixed_audio_path
+    video_timeline.audio_codec = "copy"
+
+    if params.subtitle_enabled and subtitle_path and os.path.exists(subtitle_path):
+        video_timeline.subtitle_file = write_ass_subtitles(
+            subtitle_path,
+            f"{os.path.splitext(output_file)[0]}.ass",
+            params,
+            video_timeline.width,
+            video_timeline.height,
+        )
+        video_timeline.fonts_dir = utils.font_dir()
+
+    video_timeline.save(f"{os.path.splitext(output_file)[0]}.timeline.json")
+    return timeline.render(
+        video_timeline,
         output_file,
-        audio_codec=audio_codec,
-        temp_audiofile_path=output_dir,
         threads=params.n_threads or 2,
-        logger=None,
-        fps=fps,
+        video_codec=video_codec,
+        encoder_args=profile.encoder_args(),
+        audio_bitrate=profile.audio_bitrate,
     )
-    video_clip.close()
-    del video_clip
 
 
-def preprocess_video(materials: List[MaterialInfo], clip_duration=4):
+def assemble_variant(
+    clip_files: List[str],
+    audio_file: str,
+    output_file: str,
+    duration: float,
+    profile: RenderProfile,
+    subtitle_file: str = "",
+    burn_subtitles: bool = True,
+    threads: int = 2,
+) -> str:
+    """
+    joins pre-rendered segments and the finished audio track in one ffmpeg call.
+    video and audio are stream copies, unless subtitles have to be burned in
+    """
+    list_file = ffmpeg.write_concat_list(clip_files, f"{output_file}.txt")
+    inputs = ["-f", "concat", "-safe", "0", "-i", list_file, "-i", audio_file]
+    maps = ["-map", "0:v", "-map", "1:a"]
+    if subtitle_file and burn_subtitles:
+        codecs = [
+            "-vf", ffmpeg.subtitles_filter(subtitle_file, fonts_dir=utils.font_dir()),
+            "-c:v", video_codec,
+            "-pix_fmt", "yuv420p",
+            "-r", str(profile.fps),
+            "-threads", str(threads or 2),
+            *profile.encoder_args(),
+        ]
+    elif subtitle_file:
+        # soft subtitle track, rendered by the player
+        inputs += ["-i", subtitle_file]
+        maps += ["-map", "2:s"]
+        codecs = ["-c:v", "copy", "-c:s", "mov_text"]
+    else:
+        codecs = ["-c:v", "copy"]
+    args = [*inputs, *maps, *codecs, "-c:a", "copy", "-t", f"{duration:.3f}", output_file]
+    try:
+        ffmpeg.run(args)
+    finally:
+        delete_files(list_file)
+    return output_file
+
+
+def generate_variant_videos(
+    video_paths: List[str],
+    audio_path: str,
+    subtitle_path: str,
+    output_files: List[str],
+    params: VideoParams,
+    mixed_audio_path: str = "",
+) -> List[str]:
+    """
+    renders len(output_files) variants that only differ in the order of the same clips.
+    every distinct segment of all variant timelines is rendered once, each variant is
+    then assembled with the shared audio track: by stream copy with soft subtitles
+    (segments in the final profile), or with one encode that burns the subtitles in
+    (segments in the intermediate profile, so the final encode is the only lossy one)
+    """
+    output_dir = os.path.dirname(output_files[0])
+    profile = final_render_profile(params)
+    # "burn": one video encode per variant, "soft": a subtitle track, no video encode at all
+    burn_subtitles = config.app.get("variant_subtitles", "burn").strip().lower() != "soft"
+    subtitles_enabled = bool(params.subtitle_enabled and subtitle_path and os.path.exists(subtitle_path))
+    segment_profile = get_intermediate_profile() if burn_subtitles and subtitles_enabled else profile
+    if not mixed_audio_path:
+        mixed_audio_path = mix_audio(audio_path, os.path.join(output_dir, "audio-mixed.m4a"), params)
+    with ReaderPool() as readers:
+        audio_duration = readers.audio(mixed_audio_path).duration
+
+    # one segment plan for all variants, crossfades blend neighbouring clips and could not be shared
+    base_timeline = build_timeline(
+        video_paths=video_paths,
+        audio_duration=audio_duration,
+        video_aspect=params.video_aspect,
+        video_concat_mode=params.video_concat_mode,
+        video_transition_mode=params.video_transition_mode,
+        max_clip_duration=params.video_clip_duration,
+        fps=profile.fps,
+        engine="clip",
+    )
+    timelines = [base_timeline]
+    for _ in output_files[1:]:
+        variant_entries = [entry.to_dict() for entry in base_timeline.entries]
+        random.shuffle(variant_entries)
+        timelines.append(Timeline.from_dict({**base_timeline.to_dict(), "entries": variant_entries}))
+
+    all_entries = [entry for video_timeline in timelines for entry in video_timeline.entries]
+    if not all_entries:
+        logger.warning("no clips available for rendering")
+        return []
+
+    entries, entry_indexes = unique_entries(all_entries)
+    logger.info(
+        f"rendering {len(output_files)} variants from {len(entries)} unique segments ({len(all_entries)} in total), "
+        f"segment profile: {segment_profile.name}"
+    )
+    segments = render_segments(
+        entries,
+        output_dir,
+        timelines[0].width,
+        timelines[0].height,
+        segment_profile,
+        stream_copy=True,
+        prefix="segment",
+    )
+
+    subtitle_file = ""
+    if subtitles_enabled:
+        subtitle_file = write_ass_subtitles(
+            subtitle_path,
+            os.path.join(output_dir, "subtitles.ass"),
+            params,
+            timelines[0].width,
+            timelines[0].height,
+        )
+
+    final_files = []
+    position = 0
+    for video_timeline, output_file in zip(timelines, output_files):
+        indexes = entry_indexes[position : position + len(video_timeline.entries)]
+        position += len(video_timeline.entries)
+        clip_files = [segments[i].file_path for i in indexes if segments[i]]
+        if not clip_files:
+            logger.warning(f"no segments available for {output_file}")
+            continue
+
+        video_timeline.save(f"{os.path.splitext(output_file)[0]}.timeline.json")
+        assemble_variant(
+            clip_files,
+            mixed_audio_path,
+            output_file,
+            min(audio_duration, video_timeline.duration),
+            profile,
+            subtitle_file=subtitle_file,
+            burn_subtitles=burn_subtitles,
+            threads=params.n_threads or 2,
+        )
+        final_files.append(output_file)
+        logger.info(f"variant assembled: {output_file}")
+
+    delete_files([segment.file_path for segment in segments if segment])
+    return final_files
+
+
+def ken_burns_filter(width: int, height: int, duration: float, fps: int, zoom: float) -> str:
+    """
+    centered zoom from 1 to `zoom` over the clip, computed by ffmpeg's zoompan.
+    the image is upscaled first so that the crop rectangle moves in sub-pixel steps
+    instead of jittering between whole pixels
+    """
+    frames = max(1, int(round(duration * fps)))
+    return (
+        f"scale={width * 4}:{height * 4},"
+        f"zoompan=z='1+{zoom - 1:.4f}*on/{frames}':"
+        f"x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':"
+        f"d={frames}:s={width}x{height}:fps={fps},"
+        f"setsar=1,format=yuv420p"
+    )
+
+
+def image_to_video(image_file: str, duration: float, width: int, height: int) -> str:
+    """
+    renders an image material into a ken burns clip of the given size,
+    cached by image content, duration and resolution
+    """
+    profile = get_intermediate_profile()
+    # same zoom as before: 3% per second of clip duration
+    zoom = 1 + duration * 0.03
+    cache = image_clip_cache()
+    cache_key = cache.key(file_digest(image_file), duration, width, height, zoom, video_codec, profile.to_dict())
+    # concurrent tasks using the same image wait for one render
+    with _image_clip_locks[cache_key]:
+        cached_file = cache.get(cache_key)
+        if cached_file:
+            logger.debug(f"image clip cache hit: {image_file}")
+            return cached_file
+
+        temp_file = cache.temp_file(cache_key, suffix=".render.tmp")
+        try:
+            ffmpeg.run(
+                [
+                    "-i", image_file,
+                    "-vf", ken_burns_filter(width, height, duration, profile.fps, zoom),
+                    "-t", f"{duration:.3f}",
+                    "-c:v", video_codec,
+                    *profile.encoder_args(),
+                    "-an",
+                    "-f", "mp4",
+                    temp_file,
+                ]
+            )
+            return cache.put(cache_key, temp_file)
+        finally:
+            delete_files(temp_file)
+
+
+def image_clip_size(image_width: int, image_height: int, video_aspect: VideoAspect = None):
+    # never larger than the output frame, even dimensions for yuv420p
+    width, height = image_width, image_height
+    if video_aspect:
+        video_width, video_height = VideoAspect(video_aspect).to_resolution()
+        scale = min(video_width / width, video_height / height)
+        width, height = int(width * scale), int(height * scale)
+    return max(2, width - width % 2), max(2, height - height % 2)
+
+
+def preprocess_video(materials: List[MaterialInfo], clip_duration=4, video_aspect: VideoAspect = None, output_dir: str = ""):
+    # only images are converted here, videos are probed lazily by plan_subclips.
+    # the clips are linked out of the image cache into output_dir (the task dir),
+    # so a concurrent eviction cannot remove them before they are rendered
+    output_dir = output_dir or utils.storage_dir("temp")
     for material in materials:
         if not material.url:
             continue
 
         ext = utils.parse_extension(material.url)
+        if ext not in const.FILE_TYPE_IMAGES:
+            continue
+
         try:
-            clip = VideoFileClip(material.url)
-        except Exception:
-            clip = ImageClip(material.url)
+            media_info = media_index.get(material.url)
+        except Exception as e:
+            logger.warning(f"failed to probe material: {material.url}, {str(e)}")
+            continue
 
-        width = clip.size[0]
-        height = clip.size[1]
+        width = media_info.width
+        height = media_info.height
         if width < 480 or height < 480:
             logger.warning(f"low resolution material: {width}x{height}, minimum 480x480 required")
             continue
 
-        if ext in const.FILE_TYPE_IMAGES:
-            logger.info(f"processing image: {material.url}")
-            # Create an image clip and set its duration to 3 seconds
-            clip = (
-                ImageClip(material.url)
-                .with_duration(clip_duration)
-                .with_position("center")
-            )
-            # Apply a zoom effect using the resize method.
-            # A lambda function is used to make the zoom effect dynamic over time.
-            # The zoom effect starts from the original size and gradually scales up to 120%.
-            # t represents the current time, and clip.duration is the total duration of the clip (3 seconds).
-            # Note: 1 represents 100% size, so 1.2 represents 120% size.
-            zoom_clip = clip.resized(
-                lambda t: 1 + (clip_duration * 0.03) * (t / clip.duration)
-            )
-
-            # Optionally, create a composite video clip containing the zoomed clip.
-            # This is useful when you want to add other elements to the video.
-            final_clip = CompositeVideoClip([zoom_clip])
-
-            # Output the video to a file.
-            video_file = f"{material.url}.mp4"
-            final_clip.write_videofile(video_file, fps=30, logger=None)
-            close_clip(clip)
-            material.url = video_file
-            logger.success(f"image processed: {video_file}")
-    return materials
\ No newline at end of file
+        logger.info(f"processing image: {material.url}")
+        clip_width, clip_height = image_clip_size(width, height, video_aspect)
+        cached_file = image_to_video(material.url, clip_duration, clip_width, clip_height)
+        video_file = link_or_copy(cached_file, os.path.join(output_dir, f"image-{os.path.basename(cached_file)}"))
+        material.url = video_file
+        logger.success(f"image processed: {video_file}")
+    return materials
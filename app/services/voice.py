@@ -1,4 +1,6 @@
 import asyncio
+import base64
+import json
 import os
 import re
 from datetime import datetime
@@ -18,6 +20,8 @@ from elevenlabs.core.api_error import ApiError
 from loguru import logger
 
 from app.config import config
+from app.models import const
+from app.services.utils import ffmpeg
 from app.utils import utils
 from app.services import subtitle  # 수정: Whisper fallback 위해 import 추가
 
@@ -55,16 +59,100 @@ def get_audio_duration(audio_source) -> float:
     오디오 파일 경로를 받아 길이를 초 단위로 반환합니다.
     """
     try:
-        from moviepy.editor import AudioFileClip  # 동적 임포트
-        clip = AudioFileClip(audio_source)
-        duration = clip.duration
-        clip.close()
-        return duration
+        from app.services.utils.readers import ReaderPool  # 동적 임포트
+        with ReaderPool() as readers:
+            return readers.audio(audio_source).duration
     except Exception as e:
         logger.warning(f"오디오 길이 계산 실패: {e}")
         return 0.0
 
+def alignment_to_dict(alignment) -> dict:
+    """
+    ElevenLabs 응답의 alignment(객체 또는 dict)를 dict로 변환합니다.
+    """
+    keys = ("characters", "character_start_times_seconds", "character_end_times_seconds")
+    if isinstance(alignment, dict):
+        return {k: list(alignment.get(k) or []) for k in keys}
+    return {k: list(getattr(alignment, k, None) or []) for k in keys}
+
+
+def synthetic_speech(text: str, voice_file: str, chars_per_second: float = 12.0, pause: float = 0.3) -> dict:
+    """
+    로컬 테스트용 대체 provider: API 없이 무음 오디오와 균등 간격의 문자 타임스탬프를 만듭니다.
+    """
+    characters, starts, ends = [], [], []
+    t = 0.0
+    for char in text:
+        length = pause if char in const.PUNCTUATIONS else 1.0 / chars_per_second
+        characters.append(char)
+        starts.append(round(t, 3))
+        t += length
+        ends.append(round(t, 3))
+
+    ffmpeg.run(
+        [
+            "-f", "lavfi",
+            "-i", "anullsrc=r=44100:cl=stereo",
+            "-t", f"{max(t, 0.1):.3f}",
+            "-c:a", "libmp3lame",
+            "-b:a", "128k",
+            voice_file,
+        ]
+    )
+    return {
+        "characters": characters,
+        "character_start_times_seconds": starts,
+        "character_end_times_seconds": ends,
+    }
+
+
+def tts_with_timestamps(text: str, voice_name: str, voice_file: str) -> str:
+    """
+    ElevenLabs with-timestamps 변환: 오디오와 함께 문자 단위 타임스탬프를 받아
+    subtitle.alignment_file(voice_file)에 저장합니다. 자막은 Whisper 없이 이 정렬로 생성됩니다.
+    """
+    if not voice_file:
+        voice_file = utils.task_dir() + "/tts-output.mp3"
+
+    if subtitle.get_provider() == "synthetic":
+        logger.info("synthetic TTS 생성 중 (로컬 테스트용)...")
+        alignment = synthetic_speech(text, voice_file)
+    else:
+        if ElevenLabs is None:
+            raise ImportError("ElevenLabs 패키지가 설치되어 있지 않습니다. TTS를 수행할 수 없습니다.")
+        voice_id = parse_voice_name(voice_name)
+        client = get_elevenlabs_client()
+        logger.info("ElevenLabs TTS 생성 중 (타임스탬프 포함)...")
+        try:
+            response = client.text_to_speech.convert_with_timestamps(
+                voice_id=voice_id,
+                text=text,
+                model_id="eleven_multilingual_v2",
+                output_format="mp3_44100_128"
+            )
+        except ApiError as e:
+            msg = e.body.get("detail", {}).get("message", str(e))
+            raise ValueError(f"ElevenLabs TTS 변환 실패 (status={e.status_code}): {msg}")
+
+        audio_base64 = getattr(response, "audio_base_64", None) or getattr(response, "audio_base64", None)
+        if not audio_base64:
+            raise ValueError("ElevenLabs TTS 응답에 오디오가 없습니다.")
+        with open(voice_file, "wb") as f:
+            f.write(base64.b64decode(audio_base64))
+        # 원문 기준 alignment 우선, 없으면 정규화된 텍스트 기준
+        alignment = alignment_to_dict(
+            getattr(response, "alignment", None) or getattr(response, "normalized_alignment", None) or {}
+        )
+
+    with open(subtitle.alignment_file(voice_file), "w", encoding="utf-8") as f:
+        json.dump(alignment, f, ensure_ascii=False)
+    return voice_file
+
+
 def tts(text: str, voice_name: str = "ko-KR-InJoonNeural-Male", voice_rate: float = 0.0, voice_file: str = "") -> str:
+    if subtitle.get_provider() in subtitle.timestamp_providers:
+        return tts_with_timestamps(text=text, voice_name=voice_name, voice_file=voice_file)
+
     if ElevenLabs is None:
         raise ImportError("ElevenLabs 패키지가 설치되어 있지 않습니다. TTS를 수행할 수 없습니다.")
 
@@ -92,7 +180,8 @@ def tts(text: str, voice_name: str = "ko-KR-InJoonNeural-Male", voice_rate: floa
             msg = e.body.get("detail", {}).get("message", str(e))
             raise ValueError(f"ElevenLabs TTS 스트리밍 실패 (status={e.status_code}): {msg}")
 
-    # Whisper로 자막 생성
-    subtitle_path = voice_file + ".srt"
-    subtitle.create(audio_file=voice_file, subtitle_file=subtitle_path)
+    # Whisper로 자막 생성 (대본 정렬 provider는 Whisper 불필요)
+    if subtitle.get_provider() not in subtitle.script_providers:
+        subtitle_path = voice_file + ".srt"
+        subtitle.create(audio_file=voice_file, subtitle_file=subtitle_path)
     return voice_file  # subtitle_path는 task.py에서 별도 처리
\ No newline at end of file
@@ -122,6 +122,22 @@ def song_dir(sub: str = "") -> str:
     return str(p)
 
 
+def media_dir(sub: str = "") -> str:
+    p = _cfg_path("local_media_dir", "local_media")
+    if sub:
+        p = p / sub
+    p.mkdir(parents=True, exist_ok=True)
+    return str(p)
+
+
+def cache_dir(sub: str = "") -> str:
+    p = _cfg_path("cache_dir", "storage/cache")
+    if sub:
+        p = p / sub
+    p.mkdir(parents=True, exist_ok=True)
+    return str(p)
+
+
 def public_dir(sub: str = "") -> str:
     p = _cfg_path("public_dir", "resource/public")
     if sub: